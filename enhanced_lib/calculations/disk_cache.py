@@ -0,0 +1,240 @@
+import dataclasses
+import functools
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from importlib.metadata import PackageNotFoundError, version as package_version
+from typing import Any, Callable, Dict, Optional, Tuple
+
+
+def source_hash() -> str:
+    """Hash of the sources of this package, so a checkout that isn't installed (or is
+    installed in editable mode) still gets a new version when its code changes"""
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    digest = hashlib.sha256()
+    for folder, dirs, files in sorted(os.walk(root)):
+        dirs.sort()
+        for name in sorted(files):
+            if name.endswith(".py"):
+                path = os.path.join(folder, name)
+                digest.update(os.path.relpath(path, root).encode())
+                with open(path, "rb") as f:
+                    digest.update(f.read())
+    return digest.hexdigest()[:16]
+
+
+def library_version() -> str:
+    try:
+        version = package_version("enhanced_lib")
+    except PackageNotFoundError:
+        version = "unknown"
+    return f"{version}+{source_hash()}"
+
+
+DEFAULT_PATH = os.path.join(
+    os.path.expanduser("~"), ".cache", "enhanced_lib", "results.sqlite"
+)
+
+
+class DiskCache:
+    """Bounded cache of optimiser results in a SQLite file, kept across restarts.
+
+    Keys are a hash of the library version, the name of the calculation, every field
+    of the config and the arguments, so results of an older release or another
+    config are never returned. Values are stored as JSON. Once the file holds more
+    than `maxsize` results the least recently used ones are dropped. Connections are
+    opened per thread and per process, so forked workers share the file, and a
+    cache sent to a worker reopens the file there; the hit statistics only count
+    the lookups made in this process.
+    """
+
+    def __init__(
+        self,
+        path: str = DEFAULT_PATH,
+        maxsize: int = 100_000,
+        version: Optional[str] = None,
+    ):
+        self.path = path
+        self.maxsize = maxsize
+        self.version = version or library_version()
+        self.hits = 0
+        self.misses = 0
+        self._writes = 0
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        with self._connection() as connection:
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS results"
+                " (key TEXT PRIMARY KEY, value TEXT NOT NULL, used REAL NOT NULL)"
+            )
+            connection.execute(
+                "CREATE INDEX IF NOT EXISTS results_used ON results (used)"
+            )
+
+    def _connection(self) -> sqlite3.Connection:
+        local = self._local
+        if getattr(local, "pid", None) != os.getpid():
+            local.connection = sqlite3.connect(self.path, timeout=30)
+            local.connection.execute("PRAGMA journal_mode=WAL")
+            local.connection.execute("PRAGMA synchronous=NORMAL")
+            local.pid = os.getpid()
+        return local.connection
+
+    def __reduce__(self):
+        return (open_disk_cache, (self.path, self.maxsize, self.version))
+
+    def key(self, name: str, config: Any, args: tuple) -> str:
+        if dataclasses.is_dataclass(config):
+            # shallow, `asdict` copies every field
+            config = {
+                x.name: getattr(config, x.name) for x in dataclasses.fields(config)
+            }
+        payload = json.dumps(
+            [self.version, name, config, list(args)], sort_keys=True, default=repr
+        )
+        return hashlib.sha256(payload.encode()).hexdigest()
+
+    def get(
+        self,
+        name: str,
+        config: Any,
+        args: tuple,
+        compute: Callable[[], Any],
+        keep: Optional[Callable[[Any], bool]] = None,
+    ) -> Any:
+        """Stored result of `compute`, which is called and stored on a miss unless
+        `keep` rejects its value"""
+        key = self.key(name, config, args)
+        connection = self._connection()
+        with connection:
+            row = connection.execute(
+                "SELECT value FROM results WHERE key = ?", (key,)
+            ).fetchone()
+            if row:
+                connection.execute(
+                    "UPDATE results SET used = ? WHERE key = ?", (time.time(), key)
+                )
+        if row:
+            with self._lock:
+                self.hits += 1
+            return json.loads(row[0])
+        with self._lock:
+            self.misses += 1
+            self._writes += 1
+            evict = self._writes % 100 == 0
+        value = compute()
+        if keep and not keep(value):
+            return value
+        with connection:
+            connection.execute(
+                "INSERT OR REPLACE INTO results VALUES (?, ?, ?)",
+                (key, json.dumps(value), time.time()),
+            )
+        if evict:
+            self.evict()
+        return value
+
+    def evict(self):
+        """Drop the least recently used results over `maxsize`"""
+        connection = self._connection()
+        with connection:
+            (count,) = connection.execute("SELECT COUNT(*) FROM results").fetchone()
+            if count > self.maxsize:
+                connection.execute(
+                    "DELETE FROM results WHERE key IN"
+                    " (SELECT key FROM results ORDER BY used LIMIT ?)",
+                    (count - self.maxsize,),
+                )
+
+    def resize(self, maxsize: int):
+        self.maxsize = maxsize
+        self.evict()
+
+    def clear(self):
+        connection = self._connection()
+        with connection:
+            connection.execute("DELETE FROM results")
+
+    def info(self) -> dict:
+        connection = self._connection()
+        (size,) = connection.execute("SELECT COUNT(*) FROM results").fetchone()
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / total if total else 0.0,
+                "size": size,
+                "maxsize": self.maxsize,
+                "path": self.path,
+                "version": self.version,
+            }
+
+    def reset_stats(self):
+        with self._lock:
+            self.hits = 0
+            self.misses = 0
+
+
+_opened: Dict[Tuple[str, int, str], DiskCache] = {}
+
+
+def open_disk_cache(path: str, maxsize: int, version: str) -> DiskCache:
+    """The `DiskCache` of this process for these settings, opened on first use"""
+    key = (path, maxsize, version)
+    if key not in _opened:
+        _opened[key] = DiskCache(path, maxsize=maxsize, version=version)
+    return _opened[key]
+
+
+# results of `eval_func` and `size_resolver` are only kept once this is set
+disk_cache: Optional[DiskCache] = None
+
+
+def enable_disk_cache(
+    path: str = DEFAULT_PATH, maxsize: int = 100_000, version: Optional[str] = None
+) -> DiskCache:
+    global disk_cache
+    disk_cache = DiskCache(path, maxsize=maxsize, version=version)
+    return disk_cache
+
+
+def disable_disk_cache():
+    global disk_cache
+    disk_cache = None
+
+
+def cached(
+    name: str,
+    config: Any,
+    args: tuple,
+    compute: Callable[[], Any],
+    keep: Optional[Callable[[Any], bool]] = None,
+) -> Any:
+    """`compute()` through the disk cache when it is enabled"""
+    if disk_cache is None:
+        return compute()
+    return disk_cache.get(name, config, args, compute, keep=keep)
+
+
+def call_with_cache(cache: Optional[DiskCache], func: Callable, *args) -> Any:
+    """`func(*args)` with `cache` as the disk cache"""
+    global disk_cache
+    previous = disk_cache
+    disk_cache = cache
+    try:
+        return func(*args)
+    finally:
+        disk_cache = previous
+
+
+def with_disk_cache(func: Callable) -> Callable:
+    """`func` bound to the disk cache as it is now, for tasks sent to worker
+    processes. Those keep the setting they were started with otherwise, since the
+    shared pools outlive `enable_disk_cache` and `disable_disk_cache`."""
+    return functools.partial(call_with_cache, disk_cache, func)
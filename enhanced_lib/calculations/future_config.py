@@ -1,9 +1,10 @@
-from dataclasses import dataclass
+from dataclasses import dataclass, replace
 from typing import Optional, List, Any, TypedDict, Literal
 from .trade_signal import Signal, to_f, determine_pnl, determine_expected_loss
 from . import shared, workers
 from .position_control import PositionControl
-import multiprocessing
+from .size_and_pnl import calculate_size_and_pnl_batch, SizeAndPnlColumns
+from .workers.utils import get_pool
 
 
 class TradeItem(TypedDict):
@@ -320,6 +321,9 @@ class Config:
         max_size=None,
         with_trades=False,
         ignore=False,
+        search=False,
+        tolerance=None,
+        deadline=None,
     ):
         size = max_size or self.max_size
         self.kind = kind
@@ -333,6 +337,9 @@ class Config:
             no_of_cpu=no_of_cpu,
             with_trades=with_trades,
             ignore=ignore,
+            search=search,
+            tolerance=tolerance,
+            deadline=deadline,
         )
 
     def build_trades(self):
@@ -360,6 +367,12 @@ class Config:
 class FutureInstance:
     config: Config
 
+    def with_overrides(self, **overrides) -> "FutureInstance":
+        """Instance over a copy of the config with `overrides` applied"""
+        if not overrides:
+            return self
+        return FutureInstance(replace(self.config, **overrides))
+
     def build_config(
         self,
         take_profit=None,
@@ -621,18 +634,16 @@ class FutureInstance:
         support=None,
         resistance=None,
     ):
-        old_support = self.config.support
-        old_resistance = self.config.resistance
+        instance = self
         if support and resistance:
-            self.config.support = support
-            self.config.resistance = resistance
+            instance = self.with_overrides(support=support, resistance=resistance)
 
         results = []
-        for i in self.trade_entries:
+        for i in instance.trade_entries:
             for q in i["extended_zones"]:
                 # convert to use rust code. very slow.
                 result = calculate_size_and_pnl(
-                    self,
+                    instance,
                     i["extended_zones"],
                     q,
                     _inner_kind="short",
@@ -643,9 +654,6 @@ class FutureInstance:
                 if result and result[0]:
                     if result[0].get("trade") and result[0].get("trade")[0]:
                         results.append(result)
-        if support and resistance:
-            self.config.support = old_support
-            self.config.resistance = old_resistance
         return [x for y in results for x in y]
 
     def get_trade_entries(
@@ -660,11 +668,9 @@ class FutureInstance:
         custom_stop: float = None,
     ):
         """Kind represents the inner kind and not the config kind"""
-        old_support = self.config.support
-        old_resistance = self.config.resistance
+        instance = self
         if support and resistance:
-            self.config.support = support
-            self.config.resistance = resistance
+            instance = self.with_overrides(support=support, resistance=resistance)
 
         def condition(x, _kind):
             if entry:
@@ -675,7 +681,9 @@ class FutureInstance:
                 return stop <= entry < _entry
             return True
 
-        entries = [x for x in self.trade_entries if condition(x, self.config.kind)]
+        entries = [
+            x for x in instance.trade_entries if condition(x, instance.config.kind)
+        ]
         results = []
         if entries:
             for i in entries:
@@ -686,7 +694,7 @@ class FutureInstance:
                 if custom_entry and custom_stop:
                     # needs to be a list. To refactor.
                     result = [
-                        self.determine_trades(
+                        instance.determine_trades(
                             min(custom_entry, custom_stop),
                             max(custom_entry, custom_stop),
                             kind=kind,
@@ -694,15 +702,12 @@ class FutureInstance:
                     ]
                 else:
                     result = calculate_size_and_pnl(
-                        self,
+                        instance,
                         i["zones"][kind] if within_zone else [],
                         i,
                         _inner_kind=kind,
                     )
                 results.append(result)
-            if support and resistance:
-                self.config.support = old_support
-                self.config.resistance = old_resistance
             return [x for y in results for x in y]
         return entries
 
@@ -846,6 +851,14 @@ class FutureInstance:
                 **result,
             }
 
+    def calculate_size_and_pnl_batch(
+        self, pairs, executor=None, max_workers=None, **kwargs
+    ) -> SizeAndPnlColumns:
+        """`calculate_size_and_pnl` of many (entry, stop, kind, risk) pairs as columns"""
+        return calculate_size_and_pnl_batch(
+            self, pairs, executor=executor, max_workers=max_workers, **kwargs
+        )
+
     def determine_optimum_risk(
         self,
         entry_price,
@@ -917,8 +930,25 @@ def calculate_size_and_pnl(
         result["resistance"] = resistance
         rr.append(result)
         return rr
+    # every zone asks for the same orders, only loss_price changes and orders=True
+    # ignores it. Build them once and hand each zone its own copy.
+    support = min(j["entry"], j["stop"])
+    resistance = max(j["entry"], j["stop"])
+    result = future_trader.calculate_size_and_pnl(
+        # entry_price=i["entry"],
+        # stop_price=i["stop"],
+        entry_price=resistance if _inner_kind == "long" else support,
+        stop_price=support if _inner_kind == "long" else resistance,
+        kind=_inner_kind,
+        # kind=future_trader.config.kind,
+        support=_support or support,
+        risk=future_trader.config.risk_per_trade * multiplier,
+        loss_price=zones[0]["stop"],
+        resistance=_resistance or resistance,
+        increase=True,
+        orders=True,
+    )
     for i in zones:
-        # print(i)
         # optimum_rr = future_trader.determine_optimum_risk(
         #     entry_price=i["entry"],
         #     stop_price=i["stop"],
@@ -928,24 +958,28 @@ def calculate_size_and_pnl(
         #     resistance=max(j["entry"], j["stop"]),
         #     increase=True,
         # )
-        # print(optimum_rr)
-        support = min(j["entry"], j["stop"])
-        resistance = max(j["entry"], j["stop"])
-        result = future_trader.calculate_size_and_pnl(
-            # entry_price=i["entry"],
-            # stop_price=i["stop"],
-            entry_price=resistance if _inner_kind == "long" else support,
-            stop_price=support if _inner_kind == "long" else resistance,
-            kind=_inner_kind,
-            # kind=future_trader.config.kind,
-            support=_support or support,
-            risk=future_trader.config.risk_per_trade * multiplier,
-            loss_price=i["stop"],
-            resistance=_resistance or resistance,
-            increase=True,
-            orders=True,
-        )
-        rr.append(result)
+        if result:
+            rr.append({"trade": [dict(x) for x in result["trade"]]})
+        else:
+            rr.append(result)
+    return rr
+
+
+def compact_size_and_pnl(*args):
+    """`calculate_size_and_pnl` in a worker process. Every zone of a call gets a copy
+    of the same result, so only the first and the count are sent back."""
+    rr = calculate_size_and_pnl(*args)
+    return rr[:1], len(rr)
+
+
+def expand_size_and_pnl(compact) -> list:
+    rr, count = compact
+    for _ in range(count - len(rr)):
+        result = rr[0]
+        if result:
+            rr.append({"trade": [dict(x) for x in result["trade"]]})
+        else:
+            rr.append(result)
     return rr
 
 
@@ -969,10 +1003,9 @@ def use_multi_process(
         # arguments = [(future_trader, x, j, _inner_kind) for x in zones]
         arguments = get_args(future_trader, zones, j, _inner_kind)
         # arguments = [(future_trader, x, j, _inner_kind) for x in zones]
-        with multiprocessing.Pool(processes=no_of_cpu) as pool:
-            result = pool.starmap(calculate_size_and_pnl, arguments)
-            ff = [x for y in result for x in y]
-            processes.append(ff)
+        result = get_pool(no_of_cpu).starmap(compact_size_and_pnl, arguments)
+        ff = [x for y in result for x in expand_size_and_pnl(y)]
+        processes.append(ff)
     return [x for y in processes for x in y]
 
 
@@ -0,0 +1,220 @@
+"""Array versions of the pnl, position size, close price and average primitives of
+`utils`, compiled with numba when it is installed.
+
+Each public function takes arrays (or scalars that broadcast against them) and
+returns what the scalar function gives element by element. The loops run as plain
+Python when numba is missing or `use_numba` is switched off. Rounding to price or
+size places happens outside the loops through `round_to_ticks`, which recomputes
+values close to a tie with the scalar expression.
+"""
+import typing
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+
+from .ladder import round_to_ticks
+
+try:
+    import numba
+except ImportError:  # pragma: no cover - numba is optional
+    numba = None
+
+HAS_NUMBA = numba is not None
+# compile the loops with numba, switch off to run them as plain Python
+use_numba = HAS_NUMBA
+
+_compiled: Dict[typing.Callable, typing.Callable] = {}
+
+
+def _kernel(func: typing.Callable) -> typing.Callable:
+    if not (use_numba and HAS_NUMBA):
+        # loop over python floats so errors such as a division by zero surface like
+        # they do in the scalar functions
+        return lambda *args: func(
+            *[x.tolist() if isinstance(x, np.ndarray) else x for x in args]
+        )
+    if func not in _compiled:
+        _compiled[func] = numba.njit(func)
+    return _compiled[func]
+
+
+def _arrays(*values) -> Tuple[np.ndarray, ...]:
+    return tuple(
+        np.ascontiguousarray(x, dtype=float)
+        for x in np.broadcast_arrays(*[np.asarray(x, dtype=float) for x in values])
+    )
+
+
+def _pnl_loop(entries, close_prices, quantities, long, contract_size):
+    result = np.empty(len(entries))
+    for i in range(len(entries)):
+        if contract_size:
+            direction = 1 if long else -1
+            result[i] = (
+                quantities[i]
+                * contract_size
+                * direction
+                * (1 / entries[i] - 1 / close_prices[i])
+            )
+        elif long:
+            result[i] = (close_prices[i] - entries[i]) * quantities[i]
+        else:
+            result[i] = (entries[i] - close_prices[i]) * quantities[i]
+    return result
+
+
+def _position_size_loop(entries, stops, budget, percent, as_coin, whole):
+    result = np.empty(len(entries))
+    for i in range(len(entries)):
+        if stops[i]:
+            stop_percent = abs(entries[i] - stops[i]) / entries[i]
+        else:
+            stop_percent = percent
+        if stop_percent and budget:
+            size = budget / stop_percent
+            if as_coin:
+                size = size / entries[i]
+                if whole:
+                    size = np.rint(size)
+            result[i] = size
+        else:
+            result[i] = np.nan
+    return result
+
+
+def _close_price_loop(entries, pnls, quantities, leverage, long):
+    result = np.empty(len(entries))
+    for i in range(len(entries)):
+        dollar_value = entries[i] / leverage
+        position = dollar_value * quantities[i]
+        if position:
+            percent = pnls[i] / position
+            difference = (position * percent) / quantities[i]
+            if long:
+                result[i] = difference + entries[i]
+            else:
+                result[i] = entries[i] - difference
+        else:
+            result[i] = 0.0
+    return result
+
+
+def _stop_and_size_loop(entries, pnls, take_profits, long):
+    result = np.empty(len(entries))
+    for i in range(len(entries)):
+        if long:
+            difference = take_profits[i] - entries[i]
+        else:
+            difference = entries[i] - take_profits[i]
+        result[i] = abs(pnls[i] / difference)
+    return result
+
+
+def _running_sums_loop(prices, quantities):
+    # added one after the other like `sum` does
+    values = np.empty(len(prices))
+    totals = np.empty(len(prices))
+    sum_values = 0.0
+    total_quantity = 0.0
+    for i in range(len(prices)):
+        sum_values += prices[i] * quantities[i]
+        total_quantity += quantities[i]
+        values[i] = sum_values
+        totals[i] = total_quantity
+    return values, totals
+
+
+def determine_pnls(
+    entries,
+    close_prices,
+    quantities,
+    kind: typing.Literal["long", "short"] = "long",
+    contract_size: Optional[float] = None,
+) -> np.ndarray:
+    """Array version of `determine_pnl`"""
+    entries, close_prices, quantities = _arrays(entries, close_prices, quantities)
+    return _kernel(_pnl_loop)(
+        entries, close_prices, quantities, kind == "long", float(contract_size or 0)
+    )
+
+
+def determine_position_sizes(
+    entries,
+    stops,
+    budget: float,
+    percent: Optional[float] = None,
+    min_size: Optional[float] = None,
+    as_coin=True,
+    places="%.3f",
+) -> np.ndarray:
+    """Array version of `determine_position_size`, with NaN where it returns None.
+    A stop of 0 falls back to `percent` like a missing stop does."""
+    entries, stops = _arrays(entries, np.nan_to_num(stops))
+    whole = bool(as_coin and min_size and min_size == 1)
+    sizes = _kernel(_position_size_loop)(
+        entries, stops, float(budget or 0), float(percent or 0), bool(as_coin), whole
+    )
+    valid = ~np.isnan(sizes)
+    if valid.any():
+        sizes[valid] = round_to_ticks(sizes[valid], places)
+    return sizes
+
+
+def determine_close_prices(
+    entries, pnls, quantities, leverage=1, kind: typing.Literal["long", "short"] = "long"
+) -> np.ndarray:
+    """Array version of `determine_close_price`"""
+    entries, pnls, quantities = _arrays(entries, pnls, quantities)
+    return _kernel(_close_price_loop)(
+        entries, pnls, quantities, float(leverage), kind == "long"
+    )
+
+
+def determine_stop_and_sizes(
+    entries, pnls, take_profits, kind: typing.Literal["long", "short"] = "long"
+) -> np.ndarray:
+    """Array version of `determine_stop_and_size`"""
+    entries, pnls, take_profits = _arrays(entries, pnls, take_profits)
+    return _kernel(_stop_and_size_loop)(entries, pnls, take_profits, kind == "long")
+
+
+def _running_avgs(prices, quantities, places, price_places):
+    prices, quantities = _arrays(prices, quantities)
+    values, totals = _kernel(_running_sums_loop)(prices, quantities)
+    filled = totals != 0
+    result = np.zeros(len(prices))
+    if filled.any():
+        indices = np.flatnonzero(filled)
+
+        def exact(i):
+            end = indices[i] + 1
+            return sum((prices[:end] * quantities[:end]).tolist()) / sum(
+                quantities[:end].tolist()
+            )
+
+        result[filled] = round_to_ticks(
+            values[filled] / totals[filled], price_places, rung=exact
+        )
+    sizes = round_to_ticks(
+        totals, places, rung=lambda i: sum(quantities[: i + 1].tolist())
+    )
+    return result, sizes, filled
+
+
+def determine_running_avgs(
+    prices, quantities, places="%.3f", price_places="%.1f"
+) -> Tuple[np.ndarray, np.ndarray]:
+    """`determine_avg` of every prefix of the orders, as (price, quantity) arrays"""
+    price, quantity, _ = _running_avgs(prices, quantities, places, price_places)
+    return price, quantity
+
+
+def determine_avgs(prices, quantities, places="%.3f", price_places="%.1f") -> dict:
+    """Array version of `determine_avg` over one set of orders"""
+    price, quantity, filled = _running_avgs(prices, quantities, places, price_places)
+    if not len(price):
+        return {"price": 0, "quantity": 0.0}
+    return {
+        "price": float(price[-1]) if filled[-1] else 0,
+        "quantity": float(quantity[-1]),
+    }
@@ -0,0 +1,123 @@
+import math
+import typing
+from typing import Callable, Optional, Tuple
+
+import numpy as np
+
+from .utils import get_precision, to_f, _MAX_EXACT_TICKS, _TICK_TIE_MARGIN
+
+# arrays up to this length are rounded element by element
+_SCALAR_ROUNDING = 24
+
+
+def round_to_ticks(
+    values: np.ndarray,
+    places: str,
+    rung: Optional[Callable[[int], float]] = None,
+) -> np.ndarray:
+    """Vectorised `to_f` over an array of prices.
+
+    Values are rounded through integer ticks like `Precision.round`. Elements that land
+    too close to a half tick are rounded one by one from `rung(i)` (or the value
+    itself), which lets callers recompute them with the exact scalar expression.
+    """
+    precision = get_precision(places)
+    if precision.scale is None:
+        return np.array([to_f(x, places) for x in values], dtype=float)
+    if len(values) <= _SCALAR_ROUNDING:
+        # numpy's per call overhead dominates on short ladders
+        return np.array(
+            [
+                precision.round(rung(i) if rung else x)
+                for i, x in enumerate(values.tolist())
+            ],
+            dtype=float,
+        )
+    scaled = values * precision.scale
+    ticks = np.floor(scaled)
+    fraction = scaled - ticks
+    ticks += fraction > 0.5
+    result = ticks / precision.scale
+    result = np.where(ticks == 0, np.copysign(0.0, values), result)
+    unsafe = (
+        np.abs(fraction - 0.5) <= np.abs(scaled) * _TICK_TIE_MARGIN + _TICK_TIE_MARGIN
+    ) | ~(np.abs(scaled) < _MAX_EXACT_TICKS)
+    for i in np.flatnonzero(unsafe):
+        result[i] = to_f(rung(int(i)) if rung else values[i], places)
+    return result
+
+
+def arithmetic_ladder(
+    start: float, step: float, count: int, places: str, offset: int = 0
+) -> np.ndarray:
+    """Rungs ``to_f(start + step * x)`` for ``x`` in ``offset .. offset + count - 1``"""
+    x = np.arange(offset, offset + count)
+    return round_to_ticks(start + step * x, places)
+
+
+def geometric_ladder(
+    start: float, percent_change: float, count: int, places: str, offset: int = 0
+) -> np.ndarray:
+    """Rungs ``to_f(start * (1 + percent_change) ** x)`` for ``x`` from `offset`"""
+    x = np.arange(offset, offset + count)
+    return round_to_ticks(
+        start * np.power(1 + percent_change, x),
+        places,
+        rung=lambda i: start * math.pow(1 + percent_change, i + offset),
+    )
+
+
+def range_ladder(
+    _range: Tuple[float, float], divisor: int, places: str = "%.5f"
+) -> np.ndarray:
+    """Array version of `trade_signal._get_range`"""
+    low = min(_range)
+    difference = max(_range) - low
+    if divisor == 0:
+        return np.array([max(_range)], dtype=float)
+    factor = to_f(difference / divisor, places)
+    return np.append(arithmetic_ladder(low, factor, divisor, places), max(_range))
+
+
+def filtered_ladder(
+    start: float,
+    count: int,
+    price: float,
+    places: str,
+    kind: typing.Literal["long", "short"] = "long",
+    spread: float = 0,
+    percent_change: float = 0,
+) -> Optional[np.ndarray]:
+    """First `count` rungs below (long) or above (short) `price`.
+
+    Long rungs step down arithmetically by `spread`, short rungs step up geometrically
+    by `percent_change`. Both are monotone, so the first qualifying rung is located
+    directly and the rest are generated in one pass. Returns None when no rung can ever
+    qualify because the ladder does not move, in which case callers must walk it
+    themselves.
+    """
+    if kind == "long":
+        rung = lambda x: to_f(start - (spread * x), places)
+        condition = lambda x: rung(x) <= price
+        moving = spread > 0
+        estimate = lambda: math.ceil((start - price) / spread)
+    else:
+        rung = lambda x: to_f(start * math.pow(1 + percent_change, x), places)
+        condition = lambda x: rung(x) >= price
+        moving = percent_change > 0 and start > 0
+        estimate = lambda: math.ceil(
+            math.log(price / start) / math.log(1 + percent_change)
+        )
+    if condition(0):
+        index = 0
+    elif not moving:
+        return None
+    else:
+        index = max(0, estimate())
+    while index > 0 and condition(index - 1):
+        index -= 1
+    while not condition(index):
+        index += 1
+    if kind == "long":
+        return arithmetic_ladder(start, -spread, count, places, offset=index)
+    return geometric_ladder(start, percent_change, count, places, offset=index)
@@ -9,6 +9,7 @@ from .utils import (
     to_f,
     fibonacci_analysis,
     determine_close_price,
+    determine_cumulative_avgs,
 )
 
 
@@ -195,6 +196,7 @@ def compute_total_average_for_each_trade(
     trades: List[TradeInstanceType],
     current_qty=0,
     _current_entry=0,
+    cumulative=True,
 ):
     take_profit = (
         max(app_config.entry, app_config.stop)
@@ -204,48 +206,34 @@ def compute_total_average_for_each_trade(
     current_entry = _current_entry or app_config.currentEntry
     kind = app_config.kind
 
-    def kindCondition(x, v=None, operand=None, operand_reverse=None):
-        _v = v
-        _operand = operand or operator.le
-        _operand_reverse = operand_reverse or operator.ge
-        if not _v:
-            _v = current_entry
-        if kind == "long":
-            return _operand(x["entry"], _v)
-        return _operand_reverse(x["entry"], _v)
-
-    less = [x for x in trades if kindCondition(x)]
+    averages = determine_cumulative_avgs(
+        trades,
+        current_entry,
+        current_qty,
+        kind=kind,
+        places=app_config.decimal_places,
+        price_places=app_config.price_places,
+        cumulative=cumulative,
+    )
 
-    def avgCondition(x):
-        considered = []
+    unfilled_avg = None
+    if None in averages:
+        # nothing filled yet, only the trades beyond current_entry count
         if kind == "long":
-            # considered = [y for y in trades if y["entry"] > 0]
             considered = [y for y in trades if y["entry"] > current_entry]
         else:
             considered = [y for y in trades if y["entry"] < current_entry]
-        x_pnl = None
-        remaining = [
-            v
-            for v in less
-            if kindCondition(
-                v, x["entry"], operand=operator.ge, operand_reverse=operator.le
-            )
-        ]
-        if remaining:
-            start = (
-                max([x["entry"] for x in remaining])
-                if kind == "long"
-                else min([x["entry"] for x in remaining])
-            )
-            considered = [{**x, "entry": start} for x in considered]
-            considered += remaining
-        avg_entry = build_avg(
+        unfilled_avg = build_avg(
             [{"price": x["entry"], "quantity": x["quantity"]} for x in considered]
             + [{"price": current_entry, "quantity": current_qty}],
             kind=kind,
             price_places=app_config.price_places,
             decimal_places=app_config.decimal_places,
         )
+
+    def avgCondition(x, avg_entry):
+        if avg_entry is None:
+            avg_entry = unfilled_avg
         _pnl = x.get("pnl")
         sell_price = x["sell_price"]
         loss = 0
@@ -301,4 +289,4 @@ def compute_total_average_for_each_trade(
             "e_pnl": to_f(abs(entry_loss) * (app_config.rr or 1), "%.2f"),
         }
 
-    return [avgCondition(x) for x in trades]
+    return [avgCondition(x, y) for x, y in zip(trades, averages)]
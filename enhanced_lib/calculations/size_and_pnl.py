@@ -0,0 +1,114 @@
+import itertools
+import math
+import typing
+from typing import Any, Iterable, List, Optional, Sequence
+
+import numpy as np
+
+from .trade_signal import InstanceExecutor, instance_executor
+
+# numeric fields of the "trade" summary returned by `calculate_size_and_pnl`
+SIZE_AND_PNL_COLUMNS = (
+    "entry",
+    "stop",
+    "avg_entry",
+    "avg_size",
+    "pnl",
+    "sell_price",
+    "risk",
+    "new_stop",
+    "rr",
+    "count",
+    "start_entry",
+    "ratio",
+    "loss",
+)
+
+
+class SizeAndPnlPair(typing.NamedTuple):
+    entry: float
+    stop: float
+    kind: typing.Literal["long", "short"] = "long"
+    risk: Optional[float] = None
+
+
+class SizeAndPnlColumns:
+    """`calculate_size_and_pnl` summaries of many pairs stored as parallel arrays.
+
+    Index ``i`` of every column describes ``pairs[i]``. Pairs without trades are
+    flagged in `found` and hold NaN, as do fields a summary does not have.
+    """
+
+    __slots__ = SIZE_AND_PNL_COLUMNS + ("pairs", "found")
+
+    def __init__(self, pairs: List[SizeAndPnlPair], results: List[Optional[dict]]):
+        self.pairs = pairs
+        trades = [(x or {}).get("trade") or {} for x in results]
+        self.found = np.array([bool(x) for x in trades], dtype=bool)
+        for name in SIZE_AND_PNL_COLUMNS:
+            values = [_as_float(x.get(name)) for x in trades]
+            setattr(self, name, np.array(values, dtype=float))
+
+    @property
+    def kind(self) -> List[str]:
+        return [x.kind for x in self.pairs]
+
+    def __len__(self) -> int:
+        return len(self.pairs)
+
+    def row(self, index: int) -> Optional[dict]:
+        if not self.found[index]:
+            return None
+        return {
+            name: float(value)
+            for name in SIZE_AND_PNL_COLUMNS
+            if not math.isnan(value := getattr(self, name)[index])
+        }
+
+
+def _as_float(value) -> float:
+    return math.nan if value is None else float(value)
+
+
+def _as_pair(value: Sequence[Any]) -> SizeAndPnlPair:
+    return SizeAndPnlPair(*value)
+
+
+def _size_and_pnl(target, pair: SizeAndPnlPair, kwargs: dict) -> Optional[dict]:
+    return target.calculate_size_and_pnl(
+        pair.entry, pair.stop, kind=pair.kind, risk=pair.risk, **kwargs
+    )
+
+
+def calculate_size_and_pnl_batch(
+    target,
+    pairs: Iterable[Sequence[Any]],
+    executor: InstanceExecutor = None,
+    max_workers: Optional[int] = None,
+    **kwargs,
+) -> SizeAndPnlColumns:
+    """`target.calculate_size_and_pnl` over (entry, stop, kind, risk) pairs.
+
+    `target` is a `Signal` or a `FutureInstance`, `kwargs` (support, resistance,
+    loss_price, ...) apply to every pair. Repeated pairs are computed once. Pairs
+    share the zone ladders of `zone_cache`, so a process pool gets them in contiguous
+    chunks that keep each worker's cache warm.
+    """
+    pairs = [_as_pair(x) for x in pairs]
+    unique = list(dict.fromkeys(pairs))
+    with instance_executor(executor, max_workers) as pool:
+        if pool is None:
+            results = [_size_and_pnl(target, x, kwargs) for x in unique]
+        else:
+            chunksize = max(1, len(unique) // (4 * (max_workers or 4)))
+            results = list(
+                pool.map(
+                    _size_and_pnl,
+                    itertools.repeat(target),
+                    unique,
+                    itertools.repeat(kwargs),
+                    chunksize=chunksize,
+                )
+            )
+    computed = dict(zip(unique, results))
+    return SizeAndPnlColumns(pairs, [computed[x] for x in pairs])
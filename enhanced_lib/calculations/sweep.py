@@ -0,0 +1,102 @@
+import heapq
+import typing
+from typing import Iterable, List, Optional
+
+import numpy as np
+
+from .trade_columns import TradeColumns
+
+
+class SweepCandidate(typing.TypedDict):
+    value: float
+    max: float
+    entry: float
+    stop: float
+    pnl: float
+    length: int
+    result: TradeColumns
+
+
+class RiskRewardSweep:
+    """Evaluates `Signal.default_build_entry` for many risk_reward values of one
+    (entry, stop, risk) as done by `Signal.determine_optimum_risk_reward`.
+
+    The entry config and the entry filter are resolved once. Each risk_reward value is
+    then priced as trade columns and only summarised, and the best `keep` candidates
+    are held in a bounded heap instead of sorting every candidate's trades.
+    """
+
+    def __init__(
+        self,
+        signal,
+        entry: float,
+        stop_loss: float,
+        risk: float,
+        kind="long",
+        keep=5,
+    ):
+        self.signal = signal
+        self.entry = entry
+        self.risk = risk
+        self.kind = kind
+        self.keep = keep
+        template = type(signal)(
+            **{**signal.config_as_dict, "increase_position": True}
+        )
+        self.config = template.entry_config(
+            entry,
+            stop_loss,
+            risk,
+            kind=kind,
+            take_profit=signal.take_profit,
+        )
+        self.filtered = signal.filters_entries
+
+    def build(self, risk_reward: float) -> Optional[TradeColumns]:
+        """Trades `default_build_entry` keeps for `risk_reward`, as columns"""
+        instance = type(self.signal)(
+            **{
+                **self.config,
+                "risk_reward": risk_reward,
+                "risk_per_trade": self.risk / risk_reward,
+            }
+        )
+        result = instance.get_bulk_trade_zones(self.entry, kind=self.kind, columnar=True)
+        if not result:
+            return None
+        if self.filtered:
+            kept = self.signal.keep_entry(
+                {"entry": result.entry, "stop": result.stop}, kind=self.kind
+            )
+            result = result.take(np.flatnonzero(kept))
+        return result if len(result) else None
+
+    def evaluate(self, risk_reward: float) -> Optional[SweepCandidate]:
+        trades = self.build(risk_reward)
+        if trades is None:
+            return None
+        return {
+            "value": risk_reward,
+            "max": float(trades.quantity.max()),
+            "entry": float(
+                trades.entry.max() if self.kind == "long" else trades.entry.min()
+            ),
+            "stop": float(trades.stop.max()),
+            "pnl": float(trades.pnl.max()),
+            "length": len(trades),
+            "result": trades,
+        }
+
+    def run(self, risk_rewards: Iterable[float]) -> List[SweepCandidate]:
+        """Best candidates by largest quantity, earlier values first on ties"""
+        heap = []
+        for i, risk_reward in enumerate(risk_rewards):
+            candidate = self.evaluate(risk_reward)
+            if candidate is None:
+                continue
+            item = (candidate["max"], -i, candidate)
+            if len(heap) < self.keep:
+                heapq.heappush(heap, item)
+            elif item[:2] > heap[0][:2]:
+                heapq.heapreplace(heap, item)
+        return [x[2] for x in sorted(heap, key=lambda x: x[:2], reverse=True)]
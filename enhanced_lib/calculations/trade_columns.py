@@ -0,0 +1,153 @@
+import typing
+from typing import Iterable, Iterator, List, Optional, Sequence
+
+import numpy as np
+
+from .ladder import round_to_ticks
+
+# the float columns of a trade, in the key order `Signal.build_trade_dict` uses
+TRADE_COLUMNS = (
+    "entry",
+    "risk",
+    "quantity",
+    "sell_price",
+    "incurred_sell",
+    "stop",
+    "pnl",
+    "fee",
+    "net",
+    "incurred",
+    "stop_percent",
+    "new_stop",
+)
+
+
+class TradeColumns:
+    """Trades of one ladder stored as parallel float arrays.
+
+    Index ``i`` of every column describes the same trade. `rows` gives a lazy view
+    that builds the familiar trade dicts only for the rows that are read.
+    """
+
+    __slots__ = TRADE_COLUMNS + ("rr",)
+
+    def __init__(self, rr: float = 0, **columns: Iterable[float]):
+        self.rr = rr
+        for name in TRADE_COLUMNS:
+            setattr(self, name, np.asarray(columns.get(name, ()), dtype=float))
+
+    @classmethod
+    def empty(cls, rr: float = 0) -> "TradeColumns":
+        return cls(rr)
+
+    @classmethod
+    def from_rows(cls, rows: Iterable[dict], rr: float = 0) -> "TradeColumns":
+        rows = list(rows)
+        return cls(
+            rr, **{name: [x[name] for x in rows] for name in TRADE_COLUMNS}
+        )
+
+    @classmethod
+    def concat(cls, *parts: "TradeColumns") -> "TradeColumns":
+        rr = parts[0].rr if parts else 0
+        return cls(
+            rr,
+            **{
+                name: np.concatenate([getattr(x, name) for x in parts])
+                for name in TRADE_COLUMNS
+            },
+        )
+
+    def take(self, indices: Sequence[int]) -> "TradeColumns":
+        indices = np.asarray(indices, dtype=int)
+        return TradeColumns(
+            self.rr, **{name: getattr(self, name)[indices] for name in TRADE_COLUMNS}
+        )
+
+    def __len__(self) -> int:
+        return len(self.entry)
+
+    def row(self, index: int) -> dict:
+        result = {}
+        for name in TRADE_COLUMNS:
+            if name == "new_stop":
+                result["rr"] = self.rr
+            result[name] = float(getattr(self, name)[index])
+        return result
+
+    def rows(self) -> "TradeRows":
+        return TradeRows(self)
+
+    def to_list(self) -> List[dict]:
+        columns = [getattr(self, name).tolist() for name in TRADE_COLUMNS]
+        keys = TRADE_COLUMNS[:-1] + ("rr", "new_stop")
+        return [
+            dict(zip(keys, values[:-1] + (self.rr, values[-1])))
+            for values in zip(*columns)
+        ]
+
+
+class TradeRows(typing.Sequence):
+    """Read-only sequence of trade dicts backed by a `TradeColumns`"""
+
+    __slots__ = ("columns",)
+
+    def __init__(self, columns: TradeColumns):
+        self.columns = columns
+
+    def __len__(self) -> int:
+        return len(self.columns)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self.columns.row(i) for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("trade index out of range")
+        return self.columns.row(index)
+
+    def __iter__(self) -> Iterator[dict]:
+        for i in range(len(self)):
+            yield self.columns.row(i)
+
+
+def position_sizes(
+    entries: np.ndarray,
+    stops: np.ndarray,
+    budget: float,
+    min_size: Optional[float] = None,
+    places="%.3f",
+) -> np.ndarray:
+    """Array version of `determine_position_size`, with NaN where it returns None"""
+    with np.errstate(divide="ignore", invalid="ignore"):
+        stop_percent = np.abs(entries - stops) / entries
+        size = (budget / stop_percent) / entries
+    if min_size and min_size == 1:
+        size = np.rint(size)
+    valid = (stops != 0) & (stop_percent != 0) & bool(budget)
+    result = np.full(len(entries), np.nan)
+    if valid.any():
+        result[valid] = round_to_ticks(size[valid], places)
+    return result
+
+
+def close_prices(
+    entries: np.ndarray, pnl: np.ndarray, quantity: np.ndarray, kind="long"
+) -> np.ndarray:
+    """Array version of `determine_close_price` with a leverage of 1"""
+    position = entries * quantity
+    with np.errstate(divide="ignore", invalid="ignore"):
+        percent = pnl / position
+        difference = (position * percent) / quantity
+    result = difference + entries if kind == "long" else entries - difference
+    return np.where(position != 0, result, 0.0)
+
+
+def pnls(
+    entries: np.ndarray, close_price: np.ndarray, quantity: np.ndarray, kind="long"
+) -> np.ndarray:
+    """Array version of `determine_pnl` for linear contracts"""
+    if kind == "long":
+        return (close_price - entries) * quantity
+    return (entries - close_price) * quantity
@@ -1,9 +1,29 @@
-from dataclasses import dataclass
+from dataclasses import dataclass, replace
 import math
 from typing import Iterable, List, Optional, Tuple
 import typing
 import operator
 from .utils import *
+from .ladder import (
+    filtered_ladder,
+    arithmetic_ladder,
+    geometric_ladder,
+    range_ladder,
+    round_to_ticks,
+)
+from .trade_columns import TradeColumns, position_sizes, close_prices, pnls
+from .sweep import RiskRewardSweep
+from .zone_cache import zone_cache
+import concurrent.futures
+import contextlib
+import itertools
+import numpy as np
+
+
+class ZoneSearchStats(typing.TypedDict):
+    prices: typing.List[float]
+    retries: int
+    stopped: Optional[typing.Literal["cycle", "max_retries"]]
 
 
 class TradeInstanceType(typing.TypedDict):
@@ -54,6 +74,77 @@ def _get_zone_nogen(
     return result
 
 
+def _as_tuple(value: Optional[Iterable]) -> Optional[tuple]:
+    return value if value is None else tuple(value)
+
+
+# relative distance under which a price is considered too close to a crossing or a
+# rounding boundary for the closed form to be trusted over the reference loop
+_ZONE_TOLERANCE = 1e-9
+
+
+def _is_rounding_stable(value: float, places: str) -> bool:
+    precision = get_precision(places)
+    if precision.scale is None:
+        return False
+    scaled = value * precision.scale
+    fraction = scaled - math.floor(scaled)
+    return abs(fraction - 0.5) > (abs(scaled) + 1) * _ZONE_TOLERANCE
+
+
+def _get_zone_closed_form(
+    current_price: float, focus: float, percent_change: float, places: str = "%.5f"
+) -> Optional[float]:
+    """Return the last zone `_get_zone_nogen` would produce without walking the ladder.
+
+    The bracketing index is located with logarithms and only the boundary price is
+    rounded. When a price sits within `_ZONE_TOLERANCE` of a crossing or of a rounding
+    boundary, the reference loop is used so the result is always identical to it.
+    """
+
+    def reference():
+        result = _get_zone_nogen(current_price, focus, percent_change, places=places)
+        return result[-1] if result else None
+
+    factor = 1 + percent_change
+    if not factor > 1 or focus <= 0 or current_price <= 0:
+        return reference()
+    log_factor = math.log(factor)
+    tolerance = current_price * _ZONE_TOLERANCE
+    if focus * factor > current_price:
+        # walking down by `factor` until the zone drops to or below the price
+        inverse = factor**-1
+        value = lambda k: focus * inverse**k
+        index = max(0, math.ceil(math.log(focus / current_price) / log_factor))
+        while index > 0 and value(index - 1) <= current_price:
+            index -= 1
+        while value(index) > current_price:
+            index += 1
+        last = value(index)
+        if last < 0.00001 or abs(last - current_price) <= tolerance:
+            return reference()
+        if index > 0 and abs(value(index - 1) - current_price) <= tolerance:
+            return reference()
+    else:
+        # walking up by `factor ** 2` while the zone stays at or below the price
+        value = lambda k: focus * factor ** (2 * k + 1)
+        index = max(
+            0, math.floor((math.log(current_price / focus) / log_factor - 1) / 2)
+        )
+        while index > 0 and value(index) > current_price:
+            index -= 1
+        while value(index + 1) <= current_price:
+            index += 1
+        last = value(index)
+        if abs(last - current_price) <= tolerance:
+            return reference()
+        if abs(value(index + 1) - current_price) <= tolerance:
+            return reference()
+    if not _is_rounding_stable(last, places):
+        return reference()
+    return to_f(last, places)
+
+
 # write a generator function that results values until the last value is greater than the focus
 def _get_zones(
     current_price: float, focus: float, percent_change: float, places: str = "%.5f"
@@ -87,21 +178,43 @@ def _get_zones(
 
 
 def _get_range(
-    _range: Tuple[float, float], divisor: int, places: str = "%.5f"
+    _range: Tuple[float, float], divisor: int, places: str = "%.5f", use_array=False
 ) -> List[float]:
-    difference = max(_range) - min(_range)
+    if use_array:
+        return range_ladder(_range, divisor, places=places).tolist()
+    precision = get_precision(places)
+    low = min(_range)
+    difference = max(_range) - low
     if divisor == 0:
         factor = 0
     else:
-        factor = float(places % (difference / divisor))
-    return [float(places % (min(_range) + (factor * x))) for x in range(divisor)] + [
+        factor = precision.round(difference / divisor)
+    if precision.is_exact(low) and precision.is_exact(factor):
+        # both ends sit on ticks so every rung is an exact tick count
+        low_ticks = precision.to_ticks(low)
+        factor_ticks = precision.to_ticks(factor)
+        return [
+            precision.from_ticks(low_ticks + (factor_ticks * x))
+            for x in range(divisor)
+        ] + [max(_range)]
+    return [precision.round(low + (factor * x)) for x in range(divisor)] + [
         max(_range)
     ]
 
 
 def _get_trade_zone(
-    current_price: float, array: Tuple[float, float], risk: int, places="%.5f"
+    current_price: float,
+    array: Tuple[float, float],
+    risk: int,
+    places="%.5f",
+    use_array=False,
 ) -> Optional[Tuple[float, float]]:
+    if use_array:
+        zones = range_ladder(array, risk, places=places)
+        considered = np.flatnonzero(zones > current_price)
+        if len(considered) and considered[0] > 0:
+            return (float(zones[considered[0] - 1]), float(zones[considered[0]]))
+        return None
     zones = _get_range(array, risk, places=places)
     considered = [i for i, x in enumerate(zones) if x > current_price]
     if considered and considered[0] > 0:
@@ -134,33 +247,68 @@ class Signal:
     default: Optional[bool] = False
     minimum_size: Optional[float] = None
     gap: Optional[int] = None
+    # walk the zone ladder from focus instead of locating the zone in closed form
+    use_zone_loop: Optional[bool] = False
+    # build price ladders as numpy arrays instead of rung by rung
+    use_array_ladder: Optional[bool] = True
+    # price orders as parallel arrays instead of one trade dict at a time
+    use_columnar_orders: Optional[bool] = True
+    # share margin ranges and zones with other signals through `zone_cache`
+    use_zone_cache: Optional[bool] = True
+    # average filled positions from running sums instead of re-summing every order
+    use_cumulative_avg: Optional[bool] = True
+    # give up on a price once get_bulk_trade_zones moved this many times without
+    # trades, None only stops on a cycle
+    max_zone_retries: Optional[int] = 100
 
     @property
     def risk(self) -> float:
         return self.budget * self.percent_change
 
+    def with_overrides(self, **overrides) -> "Signal":
+        """Copy of the signal with `overrides` applied. The signal itself is untouched,
+        so one instance can be shared between threads and derived from per call."""
+        if not overrides:
+            return self
+        return replace(self, **overrides)
+
     @property
     def min_trades(self) -> int:
         return int(self.risk)
 
+    @property
+    def price_precision(self) -> Precision:
+        return get_precision(self.price_places)
+
+    @property
+    def size_precision(self) -> Precision:
+        return get_precision(self.decimal_places)
+
     @property
     def min_price(self) -> float:
-        number = self.price_places.replace("%.", "").replace("f", "")
-        return 1 * 10 ** -int(number)
+        return self.price_precision.tick
 
     def get_range(self, current_price: float, kind="long") -> List[float]:
         zones = []
         risk = int(self.risk)
         future_range = self.get_future_range(current_price)
         if future_range:
-            zones = _get_range(future_range, risk, places=self.price_places)
+            zones = _get_range(
+                future_range,
+                risk,
+                places=self.price_places,
+                use_array=self.use_array_ladder,
+            )
             if kind == "short":
                 second_future_range = self.get_future_range(
                     future_range[0] - self.min_price
                 )
                 if second_future_range:
                     secondary_zones = _get_range(
-                        second_future_range, risk, places=self.price_places
+                        second_future_range,
+                        risk,
+                        places=self.price_places,
+                        use_array=self.use_array_ladder,
                     )
                     zones += secondary_zones
                     third_future_range = self.get_future_range(
@@ -168,7 +316,10 @@ class Signal:
                     )
                     if third_future_range:
                         third_zones = _get_range(
-                            third_future_range, risk, places=self.price_places
+                            third_future_range,
+                            risk,
+                            places=self.price_places,
+                            use_array=self.use_array_ladder,
                         )
                         zones += third_zones
                         zones = [x for x in sorted(zones)]
@@ -220,53 +371,106 @@ class Signal:
         margin_range = self.get_margin_range(current_price)
         if margin_range:
             future_zone = _get_trade_zone(
-                current_price, margin_range, int(self.risk), places=self.price_places
+                current_price,
+                margin_range,
+                int(self.risk),
+                places=self.price_places,
+                use_array=self.use_array_ladder,
             )
             if future_zone:
                 return (self.to_f(future_zone[0]), self.to_f(future_zone[1]))
 
     def to_f(self, number: float) -> float:
-        return float(self.price_places % number)
+        return self.price_precision.round(number)
 
     def to_df(self, current_price: float, places="%.3f"):
-        return float(places % current_price)
+        return get_precision(places).round(current_price)
+
+    def _zone_key(self, name: str, *args) -> tuple:
+        return (
+            name,
+            self.focus,
+            self.percent_change,
+            self.price_places,
+            self.use_zone_loop,
+        ) + args
 
     def get_future_zones(
         self, current_price: float, kind="long"
     ) -> Optional[List[float]]:
-        return self.get_future_range_new(current_price, kind=kind)
+        if not self.use_zone_cache:
+            return self.get_future_range_new(current_price, kind=kind)
+        key = self._zone_key(
+            "future_zones",
+            self.support,
+            self.resistance,
+            self.risk_reward,
+            self.use_array_ladder,
+            kind,
+            current_price,
+        )
+        result = zone_cache.get(
+            key, lambda: _as_tuple(self.get_future_range_new(current_price, kind=kind))
+        )
+        return result if result is None else list(result)
         # margin_range = self.get_margin_range(current_price)
         # if margin_range:
         #     return _get_range(margin_range, int(self.risk), places=self.price_places)
 
     def get_margin_zones(self, current_price: float, kind="long"):
+        if not self.use_zone_cache:
+            return self._get_margin_zones(current_price, kind=kind)
+        key = self._zone_key(
+            "margin_zones", self.support, self.resistance, kind, current_price
+        )
+        return list(
+            zone_cache.get(
+                key, lambda: tuple(self._get_margin_zones(current_price, kind=kind))
+            )
+        )
+
+    def _get_margin_zones(self, current_price: float, kind="long"):
+        zones = self.iter_margin_zones(current_price, kind=kind, stop_on_stall=False)
+        return list(itertools.islice(zones, 21))
+
+    def iter_margin_zones(
+        self, current_price: float, kind="long", stop_on_stall=True
+    ) -> typing.Iterator[Optional[Tuple[float, float]]]:
+        """Lazily walk the margin zones from `current_price` down to the support (long)
+        or up to the resistance.
+
+        Every step starts just past the previous zone. Unlike `get_margin_zones` the
+        walk is not capped. A step lands back in the same zone when the zone edge rounds
+        inwards, after which the walk can no longer move; it then ends, unless
+        `stop_on_stall` is False in which case the zone repeats forever like it does
+        (up to the cap) in `get_margin_zones`.
+        """
         if self.support and kind == "long":
-            result = []
-            start = current_price
-            counter = 0
-            while start > self.support:
-                v = self.get_margin_range(start)
-                result.append(v)
-                start = v[0] - self.min_price
-                counter += 1
-                if counter > 20:
-                    break
-            return result
-        if self.resistance:
-            result = []
-            start = current_price
-            counter = 0
-            while start < self.resistance:
-                v = self.get_margin_range(start)
-                result.append(v)
-                start = v[1] + self.min_price
-                counter += 1
-                if counter > 20:
-                    break
-            return result
-        return [self.get_margin_range(current_price)]
+            inside = lambda x: x > self.support
+            step = lambda zone: zone[0] - self.min_price
+        elif self.resistance:
+            inside = lambda x: x < self.resistance
+            step = lambda zone: zone[1] + self.min_price
+        else:
+            yield self.get_margin_range(current_price)
+            return
+        start, previous = current_price, None
+        while inside(start):
+            zone = self.get_margin_range(start)
+            if stop_on_stall and zone == previous:
+                return
+            yield zone
+            start, previous = step(zone), zone
 
     def get_margin_range(self, current_price: float) -> Optional[Tuple[float, float]]:
+        if not self.use_zone_cache:
+            return self._get_margin_range(current_price)
+        return zone_cache.get(
+            self._zone_key("margin_range", current_price),
+            lambda: self._get_margin_range(current_price),
+        )
+
+    def _get_margin_range(self, current_price: float) -> Optional[Tuple[float, float]]:
         # top_zones = []
         # for x in _get_zones(
         #     to_f(current_price - self.min_price, self.price_places),
@@ -277,16 +481,25 @@ class Signal:
         #     top_zones.append(x)
         #     if len(top_zones) > 10:
         #         break
-        top_zones = [
-            self.to_f(x)
-            for x in _get_zone_nogen(
-                # for x in _get_zones(
+        if self.use_zone_loop:
+            top_zones = [
+                self.to_f(x)
+                for x in _get_zone_nogen(
+                    # for x in _get_zones(
+                    current_price - self.min_price,
+                    self.focus,
+                    self.percent_change,
+                    places=self.price_places,
+                )
+            ]
+        else:
+            zone = _get_zone_closed_form(
                 current_price - self.min_price,
                 self.focus,
                 self.percent_change,
                 places=self.price_places,
             )
-        ]
+            top_zones = [] if zone is None else [zone]
         if top_zones:
             result = top_zones[-1]
             # result = top_zones[0]
@@ -409,6 +622,97 @@ class Signal:
                 # 'index': index,
             }
 
+    def build_trade_columns(
+        self,
+        arr: List[float],
+        stops: List[Optional[float]],
+        risk: float,
+        new_fees: float = 0,
+        kind="long",
+        take_profit=None,
+        start=0,
+        new_stops: Optional[List[float]] = None,
+    ) -> TradeColumns:
+        """`build_trade_dict` for every rung of `arr` at once.
+
+        `stops[i]` and `new_stops[i]` are what rung `i` would be priced with. The sizes
+        and fees of the rungs after each entry are computed once per ladder instead of
+        once per entry, and rows `build_trade_dict` would drop are left out.
+        """
+        new_stops = new_stops or [0] * len(arr)
+        prices = np.asarray(arr, dtype=float)
+        if self.increase_size or not np.all(prices):
+            rows = [
+                self.build_trade_dict(
+                    x,
+                    stops[i],
+                    risk,
+                    arr,
+                    i,
+                    new_fees=new_fees,
+                    kind=kind,
+                    take_profit=take_profit,
+                    start=start,
+                    new_stop=new_stops[i],
+                )
+                for i, x in enumerate(arr)
+            ]
+            return TradeColumns.from_rows(
+                [x for x in rows if x is not None], self.risk_reward
+            )
+        risk_value = self.to_df(risk)
+        sizes = position_sizes(prices[1:], prices[:-1], risk, places=self.decimal_places)
+        sized = np.flatnonzero(~np.isnan(sizes)) + 1
+        rung_fees = round_to_ticks(
+            self.fee * sizes[sized - 1] * prices[sized], "%.3f"
+        ).tolist()
+        previous_risks = list(itertools.accumulate([risk_value] * len(sized), initial=0))
+
+        index = np.array([i for i, x in enumerate(stops) if x is not None], dtype=int)
+        stop = np.array([stops[i] for i in index], dtype=float)
+        quantity = position_sizes(
+            prices[index],
+            stop,
+            risk,
+            min_size=self.minimum_size,
+            places=self.decimal_places,
+        )
+        kept = ~np.isnan(quantity) & (quantity != 0)
+        index, stop, quantity = index[kept], stop[kept], quantity[kept]
+        entry = prices[index]
+
+        incured_fees = []
+        for i in np.searchsorted(sized, index, side="right").tolist():
+            incured_fees.append(sum(rung_fees[i:]) + previous_risks[len(sized) - i])
+        fee = round_to_ticks(self.fee * quantity * entry, "%.3f")
+        increment = np.abs(len(arr) - (index + 1))
+        pnl = risk_value * (self.risk_reward + increment)
+        if self.minimum_pnl:
+            pnl = self.minimum_pnl + fee
+        sell_price = close_prices(entry, pnl, quantity, kind=kind)
+        if take_profit and not self.minimum_pnl:
+            pnl = pnls(entry, take_profit, quantity, kind=kind) + fee
+            sell_price = close_prices(entry, pnl, quantity, kind=kind)
+        incurred = round_to_ticks(np.array(incured_fees, dtype=float) + new_fees, "%.3f")
+        incurred_sell = np.where(
+            incurred != 0, close_prices(entry, incurred, quantity, kind=kind), sell_price
+        )
+        return TradeColumns(
+            self.risk_reward,
+            entry=entry,
+            risk=np.full(len(entry), risk_value),
+            quantity=quantity,
+            sell_price=round_to_ticks(sell_price, self.price_places),
+            incurred_sell=round_to_ticks(incurred_sell, self.price_places),
+            stop=stop,
+            pnl=pnl,
+            fee=fee,
+            net=round_to_ticks(pnl - fee, "%.3f"),
+            incurred=incurred,
+            stop_percent=round_to_ticks(np.abs(entry - stop) / entry, "%.3f"),
+            new_stop=[new_stops[i] for i in index.tolist()],
+        )
+
     def _trade_zones(self, current_price: float, kind="long"):
         signal = self.get_trade_range(current_price, kind=kind)
         future_range = self.get_future_range(current_price)
@@ -434,7 +738,15 @@ class Signal:
         stop_loss: float,
         trade_zones: List[float],
         kind="long",
+        columnar=False,
     ) -> typing.List[TradeInstanceType]:
+        if self.use_columnar_orders or columnar:
+            result = self.process_order_columns(
+                current_price, stop_loss, trade_zones, kind=kind
+            )
+            if columnar or result is None:
+                return result
+            return result.to_list()
         number_of_orders = len(trade_zones[1:])
         take_profit = stop_loss * (1 + (2 * self.percent_change))
         if kind == "short":
@@ -445,15 +757,12 @@ class Signal:
             # self.zone_risk = self.risk_
             risk_per_trade = self.get_risk_per_trade(number_of_orders)
             allowed_spread = self.percent_change / 100
-            limit_orders = [x for x in trade_zones[1:] if x <= self.to_f(current_price)]
-            market_orders = [x for x in trade_zones[1:] if x > self.to_f(current_price)]
+            price = self.to_f(current_price)
+            limit_orders = [x for x in trade_zones[1:] if x <= price]
+            market_orders = [x for x in trade_zones[1:] if x > price]
             if kind == "short":
-                limit_orders = [
-                    x for x in trade_zones[1:] if x >= self.to_f(current_price)
-                ]
-                market_orders = [
-                    x for x in trade_zones[1:] if x < self.to_f(current_price)
-                ]
+                limit_orders = [x for x in trade_zones[1:] if x >= price]
+                market_orders = [x for x in trade_zones[1:] if x < price]
             # print("limit_orders", limit_orders)
             # print("market_orders", market_orders)
             increase_position = self.support and self.increase_position
@@ -488,12 +797,10 @@ class Signal:
             new_stop = self.support if kind == "long" else stop_loss
             default_gap = self.gap or 1
 
+            gap_stops = create_gap_pairs(limit_orders, default_gap, as_mapping=True)
+
             def determine_stop(x):
-                gap_pairs = create_gap_pairs(limit_orders, default_gap, x)
-                if gap_pairs:
-                    _value = gap_pairs[0][1]
-                    return _value
-                return None
+                return gap_stops.get(x)
 
             # new_pairs = [(x, determine_stop(x)) for x in limit_orders]
 
@@ -593,6 +900,119 @@ class Signal:
                 return greater_than_min_size + less_than_min_size
             return total_orders
 
+    def process_order_columns(
+        self,
+        current_price: float,
+        stop_loss: float,
+        trade_zones: List[float],
+        kind="long",
+    ) -> Optional[TradeColumns]:
+        """`process_orders` with the trades kept as a `TradeColumns`"""
+        number_of_orders = len(trade_zones[1:])
+        take_profit = stop_loss * (1 + (2 * self.percent_change))
+        if kind == "short":
+            take_profit = stop_loss * math.pow((1 + (2 * self.percent_change)), -1)
+        if self.take_profit:
+            take_profit = self.take_profit
+        if number_of_orders == 0:
+            return None
+        risk_per_trade = self.get_risk_per_trade(number_of_orders)
+        price = self.to_f(current_price)
+        limit_orders = [x for x in trade_zones[1:] if x <= price]
+        market_orders = [x for x in trade_zones[1:] if x > price]
+        if kind == "short":
+            limit_orders = [x for x in trade_zones[1:] if x >= price]
+            market_orders = [x for x in trade_zones[1:] if x < price]
+        increase_position = self.support and self.increase_position
+        start = len(market_orders) + len(limit_orders)
+        market_trades = TradeColumns.empty(self.risk_reward)
+        if limit_orders and market_orders:
+            market_trades = self.build_trade_columns(
+                market_orders,
+                [
+                    (
+                        self.support
+                        if increase_position
+                        else (limit_orders[-1] if i == 0 else market_orders[i - 1])
+                    )
+                    for i in range(len(market_orders))
+                ],
+                risk_per_trade,
+                kind=kind,
+                start=start,
+                take_profit=take_profit,
+            )
+        total_incurred_market_fees = 0
+        if len(market_trades):
+            total_incurred_market_fees += float(market_trades.incurred[0])
+            total_incurred_market_fees += float(market_trades.fee[0])
+        new_stop = self.support if kind == "long" else stop_loss
+        default_gap = self.gap or 1
+
+        gap_stops = create_gap_pairs(limit_orders, default_gap, as_mapping=True)
+        limit_trades = self.build_trade_columns(
+            limit_orders,
+            [new_stop if increase_position else gap_stops.get(x) for x in limit_orders],
+            risk_per_trade,
+            new_fees=total_incurred_market_fees,
+            kind=kind,
+            start=start,
+            take_profit=take_profit,
+            new_stops=[
+                stop_loss if i == 0 else limit_orders[i - 1]
+                for i in range(len(limit_orders))
+            ],
+        )
+        total_orders = TradeColumns.concat(limit_trades, market_trades)
+        if not self.minimum_size or len(total_orders) == 0:
+            return total_orders
+        quantity = total_orders.quantity.tolist()
+        greater_than_min_size = [
+            i for i, x in enumerate(quantity) if x >= self.minimum_size
+        ]
+        less_than_min_size = [
+            i for i, x in enumerate(quantity) if x < self.minimum_size
+        ] or list(range(len(quantity)))
+        pair_size = math.ceil(self.minimum_size / quantity[-1])
+        if pair_size == 0:
+            return TradeColumns.empty(self.risk_reward)
+        if len(greater_than_min_size) == len(total_orders):
+            return total_orders
+        groups = group_into_pairs_with_sum_less_than(
+            [{"quantity": quantity[i], "index": i} for i in less_than_min_size],
+            self.minimum_size,
+        )
+        entry, risk = total_orders.entry.tolist(), total_orders.risk.tolist()
+        grouped = total_orders.take([x[0]["index"] for x in groups])
+        for i, x in enumerate(groups):
+            z = determine_avg(
+                [{"price": entry[y["index"]], **y} for y in x],
+                price_places=self.price_places,
+                places=self.decimal_places,
+            )
+            grouped.entry[i] = z["price"]
+            grouped.quantity[i] = z["quantity"]
+            grouped.risk[i] = to_f(
+                sum([risk[y["index"]] for y in x]), self.decimal_places
+            )
+            grouped.pnl[i] = to_f(
+                determine_pnl(
+                    z["price"],
+                    grouped.sell_price[i],
+                    quantity=z["quantity"],
+                    kind=kind,
+                ),
+                self.decimal_places,
+            )
+        for i in range(len(grouped)):
+            if i > 0:
+                grouped.new_stop[i] = grouped.entry[i - 1]
+            elif greater_than_min_size:
+                grouped.new_stop[i] = entry[greater_than_min_size[-1]]
+            else:
+                grouped.new_stop[i] = grouped.entry[0]
+        return TradeColumns.concat(total_orders.take(greater_than_min_size), grouped)
+
     def build_orders(
         self,
         current_price: float,
@@ -602,17 +1022,15 @@ class Signal:
         min_index=0,
         max_index=2,
     ):
-        focus = self.focus
-        if replace_focus:
-            self.focus = current_price
+        signal = self.with_overrides(focus=current_price) if replace_focus else self
         new_kind = "short" if kind == "long" else "long"
-        take_profit = self.take_profit
-        self.take_profit = None
-        result = self.get_bulk_trade_zones(current_price, kind=new_kind, limit=limit)
+        result = signal.with_overrides(take_profit=None).get_bulk_trade_zones(
+            current_price, kind=new_kind, limit=limit
+        )
         if result:
             opposite_stop = result[0]["sell_price"]
             opposite_entry = result[-1]["entry"]
-            trade_length = self.risk_reward + 1
+            trade_length = signal.risk_reward + 1
             percent_change = (
                 abs(
                     1
@@ -631,8 +1049,7 @@ class Signal:
                     opposite_stop * (1 + percent_change) ** (x * -1)
                     for x in range(trade_length)
                 ]
-            self.take_profit = take_profit
-            new_trades = [self.to_f(x) for x in new_trades]
+            new_trades = [signal.to_f(x) for x in new_trades]
             if kind == "long":
                 if new_trades[1] > current_price:
                     new_trades = sorted(
@@ -652,55 +1069,86 @@ class Signal:
             #             reverse=True,
             #         )
             print("new_trades ", new_trades)
-            result = self.process_orders(
+            result = signal.process_orders(
                 current_price=current_price,
                 stop_loss=new_trades[0],
                 trade_zones=new_trades,
                 kind=kind,
             )
 
-        self.focus = focus
         return result
 
     # def update_build_orders(self, current_price: float, orders:typing.List[])
 
-    def get_bulk_trade_zones(self, current_price: float, kind="long", limit=False):
-        futures = self.get_future_zones(current_price, kind=kind)
-        original = self.zone_risk
-        if futures:
-            values = futures
-            if values:
-                trade_zones = sorted(values)
-                if self.resistance:
-                    trade_zones = [x for x in trade_zones if x <= self.resistance]
-                    if kind == "short":
-                        trade_zones = sorted(
-                            [
-                                x
-                                for x in trade_zones
-                                #  if x >= futures[0]
-                            ],
-                            reverse=True,
-                        )
-                if trade_zones:
-                    stop_loss = trade_zones[0]
-                    result = self.process_orders(
-                        current_price, stop_loss, trade_zones, kind=kind
+    def get_bulk_trade_zones(
+        self,
+        current_price: float,
+        kind="long",
+        limit=False,
+        columnar=False,
+        stats: Optional[ZoneSearchStats] = None,
+    ):
+        """Trades for the first price, starting at `current_price`, whose ladder
+        produces any. Long ladders that produce nothing move on to the top of the
+        margin range below their lowest zone.
+
+        The walk ends when a price comes back, since it would then go around the same
+        prices forever, or after `max_zone_retries` moves. Pass a dict as `stats` to get
+        the prices tried, the number of retries and why the walk stopped.
+        """
+        visited = []
+        if stats is not None:
+            stats.update(prices=visited, retries=0, stopped=None)
+        price = current_price
+        while True:
+            visited.append(price)
+            if stats is not None:
+                stats["retries"] = len(visited) - 1
+            futures = self.get_future_zones(price, kind=kind)
+            if not futures:
+                return None
+            trade_zones = sorted(futures)
+            if self.resistance:
+                trade_zones = [x for x in trade_zones if x <= self.resistance]
+                if kind == "short":
+                    trade_zones = sorted(
+                        [
+                            x
+                            for x in trade_zones
+                            #  if x >= futures[0]
+                        ],
+                        reverse=True,
                     )
-                    if not result:
-                        if self.zone_risk == 1 and len(futures) > 100:
-                            return []
-                        if kind == "long":
-                            m_z = self.get_margin_range(futures[0])
-                            if m_z and m_z[0] < self.to_f(current_price):
-                                return self.get_bulk_trade_zones(
-                                    m_z[1], kind=kind, limit=limit
-                                )
-                    # if result and kind == "long" and self.support:
-                    #     result = [x for x in result if x["entry"] >= self.support]
-                    self.zone_risk = original
-                    return result
-        self.zone_risk = original
+            if not trade_zones:
+                return None
+            stop_loss = trade_zones[0]
+            result = self.process_orders(
+                price, stop_loss, trade_zones, kind=kind, columnar=columnar
+            )
+            if result:
+                # if result and kind == "long" and self.support:
+                #     result = [x for x in result if x["entry"] >= self.support]
+                return result
+            if self.zone_risk == 1 and len(futures) > 100:
+                return []
+            if kind != "long":
+                return result
+            m_z = self.get_margin_range(futures[0])
+            if not (m_z and m_z[0] < self.to_f(price)):
+                return result
+            if m_z[1] in visited:
+                stopped = "cycle"
+            elif (
+                self.max_zone_retries is not None
+                and len(visited) > self.max_zone_retries
+            ):
+                stopped = "max_retries"
+            else:
+                price = m_z[1]
+                continue
+            if stats is not None:
+                stats["stopped"] = stopped
+            return result
 
     def spot_trade(self, current_price: float, kind="long", limit=False, _orders=None):
         orders = _orders
@@ -753,6 +1201,12 @@ class Signal:
                 "increase_position",
                 "minimum_size",
                 "fee",
+                "use_zone_loop",
+                "use_array_ladder",
+                "use_columnar_orders",
+                "use_zone_cache",
+                "use_cumulative_avg",
+                "max_zone_retries",
             ]
         }
         return config
@@ -834,6 +1288,8 @@ class Signal:
         kind="long",
         spread=False,
         zone_increase=1,
+        executor: "InstanceExecutor" = None,
+        max_workers: Optional[int] = None,
     ):
         future_zones = self.build_orders_to_support(current_price, kind=kind)
         if future_zones:
@@ -883,32 +1339,25 @@ class Signal:
                 #     vv.additional_increase = spot_orders["risk"] * i
                 return vv
 
-            signal_instances = [Signal(**x) for x in config_array]
             signal_instances = [smart_signals(x, i) for i, x in enumerate(config_array)]
-            orders = [
-                r
-                for i, x in enumerate(signal_instances)
-                if (r := x.build_orders(current_prices[i], kind=kind, limit=True))
-            ]
-            sport_orders = [
-                r
-                for i, x in enumerate(signal_instances)
-                if (r := x.spot_trade(current_prices[i], kind=kind, limit=True))
-            ]
-            sport_orders = process_spot(sport_orders, kind=kind)
-            # run though the orders creation again but this time the instances have minimum_pnl set
-            # if kind == "short":
-            orders, sport_orders, signal_instances, current_prices = loop(
-                sport_orders, signal_instances, current_prices, kind=kind
-            )
-            if orders:
+            with instance_executor(executor, max_workers) as pool:
+                orders, sport_orders = evaluate_instances(
+                    signal_instances, current_prices, kind=kind, executor=pool
+                )
+                # run though the orders creation again but this time the instances have minimum_pnl set
+                # if kind == "short":
                 orders, sport_orders, signal_instances, current_prices = loop(
-                    sport_orders,
-                    signal_instances,
-                    current_prices,
-                    kind=kind,
-                    display=True,
+                    sport_orders, signal_instances, current_prices, kind=kind, executor=pool
                 )
+                if orders:
+                    orders, sport_orders, signal_instances, current_prices = loop(
+                        sport_orders,
+                        signal_instances,
+                        current_prices,
+                        kind=kind,
+                        display=True,
+                        executor=pool,
+                    )
 
             full_orders = sorted(
                 [v for x in orders for v in x], key=lambda x: x["entry"], reverse=True
@@ -1004,6 +1453,69 @@ class Signal:
         return the list of zones within the margin range based off the risk_reward
         it always increase the risk_reward by 1
         """
+        if self.use_array_ladder:
+            entries = self.get_future_ladder(current_price, kind=kind)
+            return entries if entries is None else entries.tolist()
+        return self._get_future_range_loop(current_price, kind=kind)
+
+    def get_future_ladder(
+        self, current_price, kind="long"
+    ) -> Optional["np.ndarray"]:
+        """Array version of `get_future_range_new`.
+
+        Long rungs are spaced arithmetically below the margin range, short rungs
+        geometrically by ``(1 + percent_change / risk_reward) ** x``.
+        """
+        margin_range = self.get_margin_range(current_price)
+        if not margin_range:
+            return None
+        if margin_range[1] < self.support:
+            return np.array([], dtype=float)
+        count = int(self.risk_reward) + 1
+        percent_change = self.percent_change / self.risk_reward
+        difference = abs(margin_range[0] - margin_range[1])
+        spread = to_f(difference / self.risk_reward, self.price_places)
+        price = self.to_f(current_price)
+        if kind == "long":
+            entries = arithmetic_ladder(
+                margin_range[1], -spread, count, self.price_places
+            )
+        else:
+            entries = geometric_ladder(
+                margin_range[1], percent_change, count, self.price_places
+            )
+        if entries.min() < price < entries.max():
+            return np.sort(entries)
+
+        def next_entries(start):
+            ladder = filtered_ladder(
+                start,
+                count,
+                price,
+                self.price_places,
+                kind=kind,
+                spread=spread,
+                percent_change=percent_change,
+            )
+            if ladder is None:
+                # the ladder never moves, walk it the way the reference does
+                return np.array(
+                    self._get_future_range_loop(current_price, kind=kind), dtype=float
+                )
+            return ladder
+
+        margin_zones = self.get_margin_zones(current_price)
+        remaining_zones = [x for x in margin_zones if x != margin_range]
+        if remaining_zones:
+            new_range = remaining_zones[0][1]
+            if new_range:
+                entries = next_entries(self.to_f(new_range))
+        if len(remaining_zones) == 0 and price <= entries.min():
+            next_focus = margin_range[0] * math.pow(1 + self.percent_change, -1)
+            return np.sort(next_entries(next_focus))
+        return np.sort(entries)
+
+    def _get_future_range_loop(self, current_price, kind="long"):
         margin_range = self.get_margin_range(current_price)
         # margin_zones = self.get_margin_zones(current_price)
         # remaining_zones = [x for x in margin_zones if x != margin_range]
@@ -1095,9 +1607,42 @@ class Signal:
         **kwargs,
     ):
         """Build out trades with tight stops to get the maximum position sizes"""
+        derived_config = self.entry_config(
+            entry_price,
+            stop_loss,
+            risk,
+            pnl=pnl,
+            kind=kind,
+            stop_percent=stop_percent,
+            no_of_trades=no_of_trades,
+            take_profit=take_profit,
+            support=support,
+        )
+        # print('derived_config', derived_config)
+        instance = Signal(**derived_config)
+        # if optimum:
+        #     breakpoint()
+        result = instance.get_bulk_trade_zones(entry_price, kind=kind) or []
+
+        # return result
+        trades = [x for x in result if self.keep_entry(x, kind=kind)]
+        return trades
+
+    def entry_config(
+        self,
+        entry_price: float,
+        stop_loss: float,
+        risk: float,
+        pnl: float = None,
+        kind="long",
+        stop_percent=None,
+        no_of_trades=1,
+        take_profit=None,
+        support=None,
+    ) -> dict:
+        """Config of the signal `default_build_entry` builds its trades from"""
         _stop_loss = stop_loss
         _entry_price = entry_price
-        _resistance = resistance
         if not _stop_loss and stop_percent:
             _stop_loss = (
                 _entry_price * (1 + stop_percent) ** -1
@@ -1131,24 +1676,25 @@ class Signal:
             "gap": self.gap,
             "increase_position": self.increase_position,
         }
-        # print('derived_config', derived_config)
-        instance = Signal(**derived_config)
-        # if optimum:
-        #     breakpoint()
-        result = instance.get_bulk_trade_zones(_entry_price, kind=kind) or []
+        return derived_config
 
-        def best_transform(x):
-            decimal_power = self.decimal_places.replace("%.", "").replace("f", "")
-            decimal_power = int(decimal_power)
-            if decimal_power < 3:
-                return True
-            if kind == "long":
-                return x["entry"] > x["stop"] + 0.5
-            return x["entry"] + 0.5 < x["stop"]
-
-        # return result
-        trades = [x for x in result if best_transform(x)]
-        return trades
+    @property
+    def filters_entries(self) -> bool:
+        """Whether `keep_entry` filters at all, only sizes with three or more decimal
+        places are"""
+        decimal_power = self.decimal_places.replace("%.", "").replace("f", "")
+        return int(decimal_power) >= 3
+
+    def keep_entry(
+        self, trade: TradeInstanceType, kind="long"
+    ) -> typing.Union[bool, np.ndarray]:
+        """Whether `default_build_entry` keeps a trade whose entry is too close to its
+        stop. Also works elementwise on arrays of entries and stops."""
+        if not self.filters_entries:
+            return True
+        if kind == "long":
+            return trade["entry"] > trade["stop"] + 0.5
+        return trade["entry"] + 0.5 < trade["stop"]
 
     def build_entry(
         self,
@@ -1251,8 +1797,30 @@ class Signal:
         lower_bound=30,
         support=None,
         upper_bound=199,
+        use_sweep=True,
     ):
         risk_rewards = [x for x in range(lower_bound, upper_bound, 1)]
+        if use_sweep:
+            sweep = RiskRewardSweep(self, entry, stop_loss, risk, kind=kind)
+            result = sweep.run(risk_rewards)
+            if single and result:
+                value = result[0]
+                return {
+                    "value": value["value"],
+                    "max": value["max"],
+                    "length": value["length"],
+                    "entry": value["entry"],
+                    "stop": value["stop"],
+                }
+            return [
+                {
+                    "value": x["value"],
+                    "max": x["max"],
+                    "pnl": x["pnl"],
+                    "entry": x["entry"],
+                }
+                for x in result
+            ]
 
         def eval_func(y):
             new_inst = Signal(
@@ -1326,47 +1894,19 @@ class Signal:
         _take_profit=0,
     ):
         take_profit = _take_profit or self.take_profit
+        averages = determine_cumulative_avgs(
+            trades,
+            current_entry,
+            current_qty,
+            kind=kind,
+            price_places=self.price_places,
+            cumulative=self.use_cumulative_avg,
+        )
 
-        def kindCondition(x, v=None, operand=None, operand_reverse=None):
-            _v = v
-            _operand = operand or operator.le
-            _operand_reverse = operand_reverse or operator.ge
-            if not _v:
-                _v = current_entry
-            if kind == "long":
-                return _operand(x["entry"], _v)
-            return _operand_reverse(x["entry"], _v)
-
-        less = [x for x in trades if kindCondition(x)]
-
-        def avgCondition(x):
-            considered = []
-            if kind == "long":
-                considered = [y for y in trades if y["entry"] > current_entry]
-            else:
-                considered = [y for y in trades if y["entry"] < current_entry]
+        def avgCondition(x, avg_entry):
             x_pnl = None
-            remaining = [
-                v
-                for v in less
-                if kindCondition(
-                    v, x["entry"], operand=operator.ge, operand_reverse=operator.le
-                )
-            ]
-            if not remaining:
+            if avg_entry is None:
                 return {**x, "pnl": x_pnl}
-            start = (
-                max([x["entry"] for x in remaining])
-                if kind == "long"
-                else min([x["entry"] for x in remaining])
-            )
-            considered = [{**x, "entry": start} for x in considered]
-            considered += remaining
-            avg_entry = determine_avg(
-                [{"price": x["entry"], "quantity": x["quantity"]} for x in considered]
-                + [{"price": current_entry, "quantity": current_qty}],
-                price_places=self.price_places,
-            )
             _pnl = x.get("pnl")
             sell_price = x["sell_price"]
             if take_profit:
@@ -1386,7 +1926,7 @@ class Signal:
                 "start_entry": current_entry,
             }
 
-        return [avgCondition(x) for x in trades]
+        return [avgCondition(x, y) for x, y in zip(trades, averages)]
 
     def build_trade_entries(
         self,
@@ -1567,6 +2107,71 @@ class Signal:
             **result,
         }
 
+    def calculate_size_and_pnl_batch(
+        self, pairs, executor=None, max_workers=None, **kwargs
+    ):
+        """`calculate_size_and_pnl` of many (entry, stop, kind, risk) pairs as columns"""
+        from .size_and_pnl import calculate_size_and_pnl_batch
+
+        return calculate_size_and_pnl_batch(
+            self, pairs, executor=executor, max_workers=max_workers, **kwargs
+        )
+
+
+InstanceExecutor = Optional[
+    typing.Union[concurrent.futures.Executor, typing.Literal["thread", "process"]]
+]
+
+
+@contextlib.contextmanager
+def instance_executor(executor: InstanceExecutor = None, max_workers=None):
+    """Executor to fan work out on: "thread" and "process" open a pool for the
+    duration of the block, an executor is used as is and None runs in the caller"""
+    if executor == "thread":
+        with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as pool:
+            yield pool
+    elif executor == "process":
+        with concurrent.futures.ProcessPoolExecutor(max_workers=max_workers) as pool:
+            yield pool
+    else:
+        yield executor
+
+
+def instance_orders(instance: Signal, current_price: float, kind="long"):
+    """`build_orders` and `spot_trade` of one instance, the orders built once"""
+    orders = instance.build_orders(current_price, kind=kind, limit=True)
+    if not orders:
+        return orders, None
+    spot = instance.spot_trade(current_price, kind=kind, limit=True, _orders=orders)
+    return orders, spot
+
+
+def evaluate_instances(
+    signal_instances: typing.List[Signal],
+    current_prices: typing.List[float],
+    kind="long",
+    executor: Optional[concurrent.futures.Executor] = None,
+):
+    """Orders and processed spot trades of every instance at its price, in order.
+    The instances are independent, so they are spread over `executor` when given."""
+    if executor is None:
+        results = [
+            instance_orders(x, current_prices[i], kind=kind)
+            for i, x in enumerate(signal_instances)
+        ]
+    else:
+        results = list(
+            executor.map(
+                instance_orders,
+                signal_instances,
+                [current_prices[i] for i in range(len(signal_instances))],
+                itertools.repeat(kind),
+            )
+        )
+    orders = [x for x, _ in results if x]
+    sport_orders = [x for _, x in results if x]
+    return orders, process_spot(sport_orders, kind=kind)
+
 
 def loop(
     sport_orders: list,
@@ -1574,6 +2179,7 @@ def loop(
     current_prices: typing.List[float],
     kind="long",
     display=False,
+    executor: "InstanceExecutor" = None,
 ):
     if len(sport_orders) != len(signal_instances):
         signal_instances = signal_instances[1:]
@@ -1583,17 +2189,10 @@ def loop(
             j.minimum_pnl = sport_orders[i]["incurred_risk"] + sport_orders[i]["risk"]
             if display:
                 print(j.minimum_pnl)
-        orders = [
-            r
-            for i, x in enumerate(signal_instances)
-            if (r := x.build_orders(current_prices[i], kind=kind, limit=True))
-        ]
-        sport_orders = [
-            r
-            for i, x in enumerate(signal_instances)
-            if (r := x.spot_trade(current_prices[i], kind=kind, limit=True))
-        ]
-        sport_orders = process_spot(sport_orders, kind=kind)
+        with instance_executor(executor) as pool:
+            orders, sport_orders = evaluate_instances(
+                signal_instances, current_prices, kind=kind, executor=pool
+            )
     else:
         orders = []
         sport_orders = []
@@ -1602,36 +2201,28 @@ def loop(
 
 
 def process_spot(arr: list, kind="long"):
-    new_array = [
-        {**x, "incurred_risk": sum(z["risk"] for z in arr[:i])}
-        for i, x in enumerate(arr)
-    ]
-
-    def custom_calc(r):
-        valid_pnl_index = [i for i, x in enumerate(r["pnl"]) if x < r["incurred_risk"]]
-        valid_entries = [r["entries"][x] for x in valid_pnl_index]
-        pnl_to_recover = [
-            abs(r["pnl"][x] - r["incurred_risk"]) for x in valid_pnl_index
-        ]
-        valid_sells = [r["sells"][x] for x in valid_pnl_index]
-        valid_quantities = [
-            determine_stop_and_size(valid_entries[i], x, valid_sells[i], kind=kind)
-            for i, x in enumerate(pnl_to_recover)
-        ]
-        result = [
-            {
-                "pnl": pnl_to_recover[i],
-                "sell": valid_sells[i],
-                "size": x,
-                "entry": valid_entries[i],
-            }
-            for i, x in enumerate(valid_quantities)
-        ]
-        if result:
-            result = max(result, key=lambda x: x["pnl"])
+    def custom_calc(r, incurred_risk):
+        # the trade that needs the most pnl to recover what was lost before it
+        result = []
+        for i, pnl in enumerate(r["pnl"]):
+            if pnl < incurred_risk:
+                pnl_to_recover = abs(pnl - incurred_risk)
+                size = determine_stop_and_size(
+                    r["entries"][i], pnl_to_recover, r["sells"][i], kind=kind
+                )
+                if not result or pnl_to_recover > result["pnl"]:
+                    result = {
+                        "pnl": pnl_to_recover,
+                        "sell": r["sells"][i],
+                        "size": size,
+                        "entry": r["entries"][i],
+                    }
         return {
             **r,
+            "incurred_risk": incurred_risk,
             "m_orders": result,
         }
 
-    return [custom_calc(x) for x in new_array]
+    # risk taken by every spot trade before each one, summed in order like `sum`
+    incurred_risks = itertools.accumulate((x["risk"] for x in arr), initial=0)
+    return [custom_calc(x, y) for x, y in zip(arr, incurred_risks)]
@@ -1,5 +1,18 @@
-from typing import Iterable, List, Optional, Tuple, TypeVar, TypedDict, Literal
+from typing import (
+    Dict,
+    Iterable,
+    List,
+    Optional,
+    Tuple,
+    TypeVar,
+    TypedDict,
+    Literal,
+    Union,
+)
+import bisect
+import functools
 import math
+import re
 import typing
 import datetime
 
@@ -53,11 +66,75 @@ def determine_new_amount_to_sell(
     return to_f(new_quantity, places)
 
 
+# scaled values above this are no longer exact enough to be rounded through ticks
+_MAX_EXACT_TICKS = 2**50
+# relative error allowed on `value * scale` before a half tick is considered a tie
+_TICK_TIE_MARGIN = 1e-12
+
+
+class Precision:
+    """Integer tick view of a ``"%.Nf"`` places string.
+
+    Prices and sizes are scaled to integer ticks of ``10 ** -N`` and only turned back
+    into floats through `from_ticks`. `round` returns exactly what
+    ``float(places % value)`` returns; the rare products that land too close to a half
+    tick to be decided from the float product fall back to string formatting.
+    """
+
+    __slots__ = ("places", "digits", "scale", "tick")
+
+    def __init__(self, places: str):
+        match = re.fullmatch(r"%\.(\d+)f", places) if isinstance(places, str) else None
+        self.places = places
+        self.digits = int(match.group(1)) if match else None
+        self.scale = 10**self.digits if match else None
+        self.tick = 1 * 10**-self.digits if match else None
+
+    def _ticks(self, value) -> Optional[int]:
+        if self.scale is None:
+            return None
+        scaled = value * self.scale
+        if not -_MAX_EXACT_TICKS < scaled < _MAX_EXACT_TICKS:
+            return None
+        ticks = math.floor(scaled)
+        fraction = scaled - ticks
+        if abs(fraction - 0.5) <= abs(scaled) * _TICK_TIE_MARGIN + _TICK_TIE_MARGIN:
+            return None
+        return ticks + 1 if fraction > 0.5 else ticks
+
+    def to_ticks(self, value) -> int:
+        ticks = self._ticks(value)
+        if ticks is None:
+            return round(float(self.places % value) * self.scale)
+        return ticks
+
+    def from_ticks(self, ticks: int) -> float:
+        return ticks / self.scale
+
+    def round(self, value) -> float:
+        ticks = self._ticks(value)
+        if ticks is None:
+            return float(self.places % value)
+        if ticks == 0:
+            return math.copysign(0.0, value)
+        return ticks / self.scale
+
+    def is_exact(self, value) -> bool:
+        """True when `value` already sits on a tick of this precision"""
+        ticks = self._ticks(value)
+        return ticks is not None and ticks / self.scale == value
+
+
+@functools.lru_cache(maxsize=64)
+def get_precision(places: str) -> Precision:
+    return Precision(places)
+
+
 def to_f(value, places="%.1f"):
     v = value
     if isinstance(v, str):
         v = float(value)
-    return float(places % v)
+    return get_precision(places).round(v)
 
 
 def determine_stop_and_size(entry: float, pnl: float, take_profit: float, kind="long"):
@@ -225,6 +302,114 @@ def determine_avg(orders: typing.List[OrderType], places="%.3f", price_places="%
     return {"price": avg_value, "quantity": to_f(total_quantity, places)}
 
 
+# ladders longer than this are averaged order by order, running sums over them could
+# drift from `sum` by more than the rounding tie margin
+_MAX_CUMULATIVE_ORDERS = 2000
+
+
+def _filled_orders(trades, current_entry, entry, current_qty=0, kind="long"):
+    if kind == "long":
+        beyond = [y for y in trades if y["entry"] > current_entry]
+        filled = [y for y in trades if entry <= y["entry"] <= current_entry]
+    else:
+        beyond = [y for y in trades if y["entry"] < current_entry]
+        filled = [y for y in trades if entry >= y["entry"] >= current_entry]
+    if not filled:
+        return None
+    entries = [y["entry"] for y in filled]
+    start = max(entries) if kind == "long" else min(entries)
+    return (
+        [{"price": start, "quantity": y["quantity"]} for y in beyond]
+        + [{"price": y["entry"], "quantity": y["quantity"]} for y in filled]
+        + [{"price": current_entry, "quantity": current_qty}]
+    )
+
+
+def determine_cumulative_avgs(
+    trades: typing.List[typing.Any],
+    current_entry: float,
+    current_qty=0,
+    kind="long",
+    places="%.3f",
+    price_places="%.1f",
+    cumulative=True,
+) -> typing.List[typing.Optional[dict]]:
+    """`determine_avg` of the position held once each trade of a ladder is filled.
+
+    That position is made of the trades beyond `current_entry` moved to the first
+    filled entry, the trades from `current_entry` up to and including the trade, and
+    `current_qty` at `current_entry`. None where no trade is filled yet.
+
+    When the trades up to `current_entry` are ordered outwards from it, every position
+    extends the previous one, so running sums are kept instead of averaging each
+    position from scratch. The sums are accumulated in the order `determine_avg` adds
+    them; averages that land within the tie margin of a rounding boundary are still
+    recomputed from the orders.
+    """
+
+    def reference(x):
+        orders = _filled_orders(
+            trades, current_entry, x["entry"] or current_entry, current_qty, kind
+        )
+        if orders is None:
+            return None
+        return determine_avg(orders, places=places, price_places=price_places)
+
+    if kind == "long":
+        beyond = [y for y in trades if y["entry"] > current_entry]
+        less = [y for y in trades if y["entry"] <= current_entry]
+    else:
+        beyond = [y for y in trades if y["entry"] < current_entry]
+        less = [y for y in trades if y["entry"] >= current_entry]
+    entries = [y["entry"] for y in less]
+    outwards = all(
+        (a >= b if kind == "long" else a <= b) for a, b in zip(entries, entries[1:])
+    )
+    if not cumulative or not outwards or len(trades) > _MAX_CUMULATIVE_ORDERS:
+        return [reference(x) for x in trades]
+
+    sum_values = 0
+    total_quantity = 0
+    if entries:
+        for y in beyond:
+            sum_values += entries[0] * y["quantity"]
+            total_quantity += y["quantity"]
+    running = [(sum_values, total_quantity)]
+    for y in less:
+        sum_values += y["entry"] * y["quantity"]
+        total_quantity += y["quantity"]
+        running.append((sum_values, total_quantity))
+    # `bisect` needs ascending keys, long entries run downwards
+    keys = [-x for x in entries] if kind == "long" else entries
+    size_precision = get_precision(places)
+    price_precision = get_precision(price_places)
+    current_value = current_entry * current_qty
+    result = []
+    for x in trades:
+        entry = x["entry"] or current_entry
+        filled = bisect.bisect_right(keys, -entry if kind == "long" else entry)
+        if filled == 0:
+            result.append(None)
+            continue
+        sum_values, total_quantity = running[filled]
+        sum_values += current_value
+        total_quantity += current_qty
+        if (
+            not total_quantity
+            or size_precision._ticks(total_quantity) is None
+            or price_precision._ticks(sum_values / total_quantity) is None
+        ):
+            result.append(reference(x))
+            continue
+        result.append(
+            {
+                "price": price_precision.round(sum_values / total_quantity),
+                "quantity": size_precision.round(total_quantity),
+            }
+        )
+    return result
+
+
 def group_into_pairs(arr: typing.List[typing.Any], size: int):
     return [arr[i : i + size] for i in range(0, len(arr), size)]
 
@@ -366,8 +551,8 @@ def determine_stop_and_tp(entry: float, size: float, pnl: float, kind="long"):
 
 
 def create_gap_pairs(
-    arr: List[T], gap: int, item: Optional[T] = None
-) -> List[Tuple[T, T]]:
+    arr: List[T], gap: int, item: Optional[T] = None, as_mapping=False
+) -> Union[List[Tuple[T, T]], Dict[T, T]]:
     """
     Creates pairs of elements from an array based on a specified gap.
 
@@ -375,10 +560,19 @@ def create_gap_pairs(
         arr: Input list of elements
         gap: The gap between elements to create pairs
         item: Optional item to filter pairs by
+        as_mapping: Return a dict from each element to the element the `item` filter
+            would pair it with, built in a single pass
 
     Returns:
         List of tuples containing paired elements
     """
+    if as_mapping:
+        mapping: Dict[T, T] = {}
+        for i in range(len(arr) - 1, -1, -1):
+            paired_element = arr[0] if i - gap < 0 else arr[i - gap]
+            if arr[i] != paired_element:
+                mapping.setdefault(arr[i], paired_element)
+        return mapping
     if len(arr) == 0:
         return []
     result: List[Tuple[T, T]] = []
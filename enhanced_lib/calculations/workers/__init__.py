@@ -1,6 +1,13 @@
 from .optimum_risk_reward import (
+    Deadline,
+    aiter_optimum_reward,
+    aiter_optimum_risk,
     determine_optimum_reward,
     determine_optimum_risk,
     determine_optimum_stop,
-    eval_func
+    eval_func,
+    iter_optimum_reward,
+    iter_optimum_risk,
+    optimise_zone,
+    optimise_zones,
 )
@@ -1,8 +1,19 @@
+import asyncio
+import bisect
+import concurrent.futures
+import logging
+import threading
 import typing
+from dataclasses import replace
 from ..shared import AppConfig, build_config, to_f
-from .utils import run_in_parallel, chunks_in_threads
+from ..disk_cache import cached, with_disk_cache
+from ..trade_signal import InstanceExecutor, instance_executor
+from .utils import run_in_parallel, chunks_in_threads, get_process_executor
+import itertools
 import math
-import signal
+import time
+
+logger = logging.getLogger(__name__)
 
 
 class EvalFuncType(typing.TypedDict):
@@ -15,7 +26,43 @@ class EvalFuncType(typing.TypedDict):
     max_index: int
 
 
-def eval_func(y: int, config: AppConfig, increase=None) -> typing.List[EvalFuncType]:
+class TimeoutException(Exception):
+    pass
+
+
+class Deadline:
+    """Time budget shared by the steps of an optimisation.
+
+    The steps check it between evaluations and raise `TimeoutException` once it has
+    passed, after which the callers return the best result found so far flagged
+    with ``"partial": True``. It pickles with the absolute expiry, so workers of a
+    process pool on the same machine stop at the same time; `cancel` only reaches
+    the threads of this process.
+    """
+
+    def __init__(self, seconds: typing.Optional[float] = None):
+        self.expires = None if seconds is None else time.monotonic() + seconds
+        self.cancelled = False
+
+    def cancel(self):
+        self.cancelled = True
+
+    @property
+    def expired(self) -> bool:
+        return self.cancelled or (
+            self.expires is not None and time.monotonic() >= self.expires
+        )
+
+    def check(self):
+        if self.expired:
+            raise TimeoutException()
+
+
+def eval_func(
+    y: int, config: AppConfig, increase=None, deadline: typing.Optional[Deadline] = None
+) -> typing.List[EvalFuncType]:
+    if deadline:
+        deadline.check()
     profit = config.take_profit
     if not profit:
         profit = (
@@ -207,6 +254,240 @@ def find_index_by_condition(
     return maximum
 
 
+class RewardSelector:
+    """Streaming version of `select_optimum_reward`.
+
+    Takes `eval_func` results one at a time in risk_reward order and keeps only the
+    ones that can still be picked, following `find_index_by_condition`: the results
+    with a positive net_diff (neg.pnl + risk_per_trade), or while there are none the
+    ones sharing the highest net_diff. The "quantity" strategy ranks them by total
+    then net_diff after the `loss` filter, any other strategy folds them on the
+    entry. `top` holds the best `k` of the ranking.
+    """
+
+    def __init__(self, app_config: AppConfig, loss=None, k=1):
+        self.kind = app_config.kind
+        self.criterion = app_config.strategy or "quantity"
+        self.loss = loss
+        self.k = k
+        self.count = 0
+        self.positive = False
+        self.highest = None
+        self.ranked = []
+        self.folded = None
+
+    def passCriterion(self, x: EvalFuncType):
+        if self.criterion != "quantity":
+            return True
+        if isinstance(x, list):
+            return False
+        found_index = x["max_index"]
+        if found_index == 0:
+            return True
+        return found_index > -1
+
+    def add(self, x: EvalFuncType):
+        if not x.get("result") or not self.passCriterion(x):
+            return
+        index = self.count
+        self.count += 1
+        net_diff = x["neg.pnl"] + x["risk_per_trade"]
+        if net_diff > 0:
+            if not self.positive:
+                self.positive = True
+                self.ranked = []
+                self.folded = None
+        elif self.positive:
+            return
+        elif self.highest is None or net_diff > self.highest:
+            self.highest = net_diff
+            self.ranked = []
+            self.folded = None
+        elif net_diff < self.highest:
+            return
+        criterion = self.criterion != "quantity" or not self.loss
+        if criterion or abs(x["neg.pnl"]) >= self.loss:
+            bisect.insort(self.ranked, ((-x["total"], -net_diff, index), x))
+            del self.ranked[self.k :]
+        if self.folded is None or (
+            net_diff < self.folded[0] and self.entry_condition(x, self.folded[1])
+        ):
+            self.folded = (net_diff, x)
+
+    def entry_condition(self, a, b):
+        if self.kind == "long":
+            return a["entry"] > b["entry"]
+        return a["entry"] < b["entry"]
+
+    def top(self) -> typing.List[EvalFuncType]:
+        # a highest net_diff of 0 doesn't pass the ranking condition
+        if not self.positive and self.highest == 0:
+            return []
+        return [x for _, x in self.ranked]
+
+    def best(self) -> typing.Optional[EvalFuncType]:
+        if not self.count:
+            raise ValueError("No evaluation with trades to pick from")
+        if self.criterion == "quantity":
+            top = self.top()
+            return top[0] if top else None
+        return self.folded[1]
+
+
+def select_optimum_reward(
+    func: typing.Iterable[EvalFuncType], app_config: AppConfig, loss=None
+) -> typing.Optional[EvalFuncType]:
+    """The evaluation `determine_optimum_reward` picks out of `func`, which holds
+    `eval_func` results in risk_reward order. None when no evaluation qualifies."""
+    selector = RewardSelector(app_config, loss=loss)
+    for x in func:
+        selector.add(x)
+    return selector.best()
+
+
+def pick_optimum_reward(
+    func: typing.List[EvalFuncType], app_config: AppConfig, loss=None
+) -> typing.Optional[EvalFuncType]:
+    """`select_optimum_reward` over part of the values, None when none of them has
+    trades"""
+    try:
+        return select_optimum_reward(func, app_config, loss=loss)
+    except ValueError:
+        return None
+
+
+def search_optimum_reward(
+    risk_rewards: typing.List[int],
+    evaluate: typing.Callable[[typing.List[int]], typing.List[EvalFuncType]],
+    app_config: AppConfig,
+    loss=None,
+    step=8,
+    max_rounds=4,
+) -> typing.Optional[EvalFuncType]:
+    """`select_optimum_reward` over a sample of `risk_rewards`.
+
+    Every `step`-th value is evaluated first to bracket the optimum, then every value
+    within `step` of the current pick, until the pick stops moving or `max_rounds`
+    refinements ran. Assumes the selection metrics are piecewise monotone in
+    risk_reward, so it can miss an isolated optimum the full scan finds. `evaluate`
+    gets the values of each round together so they can be spread over workers.
+    """
+    evaluated = {}
+
+    def select(indices):
+        missing = [i for i in indices if i not in evaluated]
+        evaluated.update(zip(missing, evaluate([risk_rewards[i] for i in missing])))
+        func = [evaluated[i] for i in sorted(evaluated)]
+        if not [x for x in func if x.get('result')]:
+            return None
+        return select_optimum_reward(func, app_config, loss=loss)
+
+    last = len(risk_rewards) - 1
+    best = select(sorted(set(range(0, last, step)) | {last}))
+    if best is None:
+        # nothing in the sample qualified, there is no bracket to refine
+        return select(range(len(risk_rewards)))
+    for _ in range(max_rounds):
+        center = risk_rewards.index(best["value"])
+        window = range(max(0, center - step + 1), min(last, center + step - 1) + 1)
+        if all(i in evaluated for i in window):
+            break
+        best = select(window)
+    return best
+
+
+def summarize_eval(x: EvalFuncType) -> EvalFuncType:
+    """`x` without its trades, "result" holds their count so it stays as truthy"""
+    if not isinstance(x, dict) or not isinstance(x["result"], list):
+        return x
+    return {**x, "result": len(x["result"])}
+
+
+def eval_chunk(
+    risk_rewards: typing.List[int],
+    app_config: AppConfig,
+    increase=None,
+    deadline: typing.Optional[Deadline] = None,
+    summary=False,
+) -> typing.List[EvalFuncType]:
+    """`eval_func` over a chunk of risk_reward values, one task of a parallel sweep.
+    Stops at the deadline, so it can return fewer results than values. With
+    `summary` the trades are left out, see `summarize_eval`."""
+    result = []
+    for x in risk_rewards:
+        try:
+            value = cached(
+                "eval_func",
+                app_config,
+                (x, increase),
+                lambda: eval_func(x, app_config, increase=increase, deadline=deadline),
+            )
+        except TimeoutException:
+            break
+        result.append(summarize_eval(value) if summary else value)
+    return result
+
+
+def iter_eval_risk_rewards(
+    risk_rewards: typing.List[int],
+    app_config: AppConfig,
+    increase=None,
+    executor=None,
+    no_of_cpu=4,
+    deadline: typing.Optional[Deadline] = None,
+    summary=False,
+) -> typing.Iterator[typing.Tuple[int, EvalFuncType]]:
+    """(value, `eval_func` result) of each value evaluated before the deadline, in
+    order, only summarized when `summary` is set. Without an executor they are
+    evaluated one at a time as they are asked for, else spread over `executor` in
+    about two chunks per cpu."""
+    if executor is None or len(risk_rewards) < 2:
+        for x in risk_rewards:
+            values = eval_chunk([x], app_config, increase, deadline, summary)
+            if not values:
+                return
+            yield x, values[0]
+        return
+    size = math.ceil(len(risk_rewards) / (2 * no_of_cpu))
+    chunks = group_in_pairs(risk_rewards, size)
+    task = eval_chunk
+    if isinstance(executor, concurrent.futures.ProcessPoolExecutor):
+        task = with_disk_cache(eval_chunk)
+    result = executor.map(
+        task,
+        chunks,
+        itertools.repeat(app_config),
+        itertools.repeat(increase),
+        itertools.repeat(deadline),
+        itertools.repeat(summary),
+    )
+    for chunk, values in zip(chunks, result):
+        yield from zip(chunk, values)
+
+
+def eval_risk_rewards(
+    risk_rewards: typing.List[int],
+    app_config: AppConfig,
+    increase=None,
+    executor=None,
+    no_of_cpu=4,
+    deadline: typing.Optional[Deadline] = None,
+    summary=False,
+) -> typing.Dict[int, EvalFuncType]:
+    """`iter_eval_risk_rewards` as a dict"""
+    return dict(
+        iter_eval_risk_rewards(
+            risk_rewards,
+            app_config,
+            increase=increase,
+            executor=executor,
+            no_of_cpu=no_of_cpu,
+            deadline=deadline,
+            summary=summary,
+        )
+    )
+
+
 def determine_optimum_reward(
     app_config: AppConfig,
     no_of_cpu=4,
@@ -215,55 +496,95 @@ def determine_optimum_reward(
     ignore=False,
     loss=None,
     increase=None,
+    search=False,
+    verify=False,
+    executor: InstanceExecutor = None,
+    deadline: typing.Optional[Deadline] = None,
 ):
-    criterion = app_config.strategy or "quantity"
+    """Best risk_reward between 30 and 198 for `app_config`.
+
+    Every value is evaluated unless `search` is set, which evaluates a few dozen
+    through `search_optimum_reward`. `verify` also runs the full scan and raises when
+    both pick different values. The evaluations run on `executor` ("thread",
+    "process" with `no_of_cpu` workers, or an executor) when given, else in the caller.
+    Once `deadline` passes the best of the values evaluated so far is picked, marked
+    ``"partial"`` when `app_config.raw` is set; `TimeoutException` is raised when
+    none of them qualifies.
+    """
     risk_rewards = [x for x in range(30, 199, gap)]
     # if criterion == "quantity":
     #     risk_rewards = [x for x in range(100, 199, gap)]
+    evaluated = {}
 
-    # run each risk reward through the eval function in parallel using multiprocessing
-    def passCriterion(x: EvalFuncType):
-        if criterion != "quantity":
-            return True
-        if isinstance(x, list):
-            return False
-        found_index = x["max_index"]
-        # found_index = find_index_by_condition(
-        #     x["result"], lambda j: j["quantity"] == x["max"]
-        # )
-        if found_index == 0:
-            return True
-        return found_index > -1
-    
-    func = [eval_func(x, app_config, increase=increase) for x in risk_rewards]
-    func = [x for x in func if x.get('result')]
-    highest = 0
-    new_func = []
-    for j in func:
-        if passCriterion(j):
-            new_func.append(j)
-            if criterion == "quantity":
-                highest = max(highest, j["max"])
-            else:
-                if app_config.kind == "long":
-                    highest = max(highest, j["entry"])
-                else:
-                    highest = min(highest, j["entry"]) if highest > 0 else j["entry"]
-    old_func = [x for x in func]
-    # breakpoint()
-    func = new_func
-    key = "max" if criterion == "quantity" else "entry"
-    index = find_index_by_condition(
-        func,
-        app_config.kind,
-        criterion,
-        loss=loss,
-        # default_key="pnl" if app_config.kind == "short" else "max",
-    )
-    if index > -1:
+    with instance_executor(executor, no_of_cpu) as pool:
+
+        def scan(values, keep_trades=False):
+            # the scan only keeps the trades of its best result, see RewardSelector
+            missing = [x for x in values if x not in evaluated]
+            fresh = iter_eval_risk_rewards(
+                missing,
+                app_config,
+                increase=increase,
+                executor=pool,
+                no_of_cpu=no_of_cpu,
+                deadline=deadline,
+                # process workers only send back summaries, the trades of the pick
+                # are rebuilt below
+                summary=isinstance(pool, concurrent.futures.ProcessPoolExecutor),
+            )
+            pending = next(fresh, None)
+            for x in values:
+                if pending and pending[0] == x:
+                    result = pending[1]
+                    evaluated[x] = result if keep_trades else summarize_eval(result)
+                    yield x, result
+                    pending = next(fresh, None)
+                elif x in evaluated:
+                    yield x, evaluated[x]
+
+        def evaluate(values):
+            result = dict(scan(values, keep_trades=True))
+            if len(result) < len(values):
+                raise TimeoutException()
+            return [result[x] for x in values]
+
+        try:
+            if search:
+                optimum = search_optimum_reward(
+                    risk_rewards, evaluate, app_config, loss=loss
+                )
+            if not search or verify:
+                # run each risk reward through the eval function in parallel using multiprocessing
+                selector = RewardSelector(app_config, loss=loss)
+                for _, result in scan(risk_rewards):
+                    selector.add(result)
+                if len(evaluated) < len(risk_rewards):
+                    raise TimeoutException()
+                scanned = selector.best()
+                if search and (optimum and optimum["value"]) != (
+                    scanned and scanned["value"]
+                ):
+                    raise Exception(
+                        "Search picked risk_reward",
+                        optimum and optimum["value"],
+                        "but the full scan picked",
+                        scanned and scanned["value"],
+                    )
+                optimum = scanned
+        except TimeoutException:
+            func = [evaluated[x] for x in risk_rewards if x in evaluated]
+            optimum = pick_optimum_reward(func, app_config, loss=loss)
+            if not optimum:
+                raise
+            optimum = {**optimum, "partial": True}
+    if optimum and not isinstance(optimum["result"], list):
+        # only the summary was kept
+        trades = eval_chunk([optimum["value"]], app_config, increase=increase)
+        optimum = {**optimum, "result": trades[0]["result"]}
+    if optimum:
         if app_config.raw:
-            return func[index]
-        return func[index].get("value")
+            return optimum
+        return optimum.get("value")
     # print("func", func)
     # print("old_func", old_func)
     # print("highest", highest)
@@ -294,12 +615,42 @@ class RiskType(typing.TypedDict):
 
 
 def size_resolver(
-    trade_no: float, app_config: AppConfig, no_of_cpu=4, with_trades=False, ignore=False
+    trade_no: float,
+    app_config: AppConfig,
+    no_of_cpu=4,
+    with_trades=False,
+    ignore=False,
+    executor: InstanceExecutor = None,
+    deadline: typing.Optional[Deadline] = None,
 ) -> RiskType:
-    app_config.risk_per_trade = trade_no
-    app_config.raw = True
+    return cached(
+        "size_resolver",
+        app_config,
+        (trade_no, with_trades),
+        lambda: resolve_size(
+            trade_no, app_config, no_of_cpu, with_trades, executor, deadline
+        ),
+        keep=lambda x: not x.get("partial"),
+    )
+
+
+def resolve_size(
+    trade_no: float,
+    app_config: AppConfig,
+    no_of_cpu=4,
+    with_trades=False,
+    executor: InstanceExecutor = None,
+    deadline: typing.Optional[Deadline] = None,
+) -> RiskType:
+    app_config = replace(app_config, risk_per_trade=trade_no, raw=True)
 
-    result = determine_optimum_reward(app_config, no_of_cpu=no_of_cpu, ignore=True)
+    result = determine_optimum_reward(
+        app_config,
+        no_of_cpu=no_of_cpu,
+        ignore=True,
+        executor=executor,
+        deadline=deadline,
+    )
     if result:
         r = {
             "value": trade_no,
@@ -308,6 +659,8 @@ def size_resolver(
         }
         if with_trades:
             r["trades"] = result["result"]
+        if result.get("partial"):
+            r["partial"] = True
         return r
     raise Exception("No optimum reward found")
     # return {
@@ -317,38 +670,56 @@ def size_resolver(
     # }
 
 
-class TimeoutException(Exception):
-    pass
-
-
-def timeout_handler(signum, frame):
-    raise TimeoutException()
-
-
-signal.signal(signal.SIGALRM, timeout_handler)
-
-
 def group_in_pairs(array, pairs=2):
     return [array[i : i + pairs] for i in range(0, len(array), pairs)]
 
 
 def single_worker_on_array(
-    app_config: AppConfig, risk_rewards: typing.List[float], no_of_cpu=4, ignore=False
+    app_config: AppConfig,
+    risk_rewards: typing.List[float],
+    no_of_cpu=4,
+    ignore=False,
+    deadline: typing.Optional[Deadline] = None,
+    executor: typing.Optional[concurrent.futures.Executor] = None,
 ):
-    return [
-        size_resolver(x, app_config, no_of_cpu=no_of_cpu, ignore=ignore)
-        for x in risk_rewards
-    ]
+    result = []
+    for x in risk_rewards:
+        try:
+            result.append(
+                size_resolver(
+                    x,
+                    app_config,
+                    no_of_cpu=no_of_cpu,
+                    ignore=ignore,
+                    executor=executor,
+                    deadline=deadline,
+                )
+            )
+        except TimeoutException:
+            break
+        if deadline and deadline.expired:
+            break
+    return result
 
 
 def spawn_workers_on_array(
-    app_config: AppConfig, risk_rewards: typing.List[float], no_of_cpu=4, ignore=False
+    app_config: AppConfig,
+    risk_rewards: typing.List[float],
+    no_of_cpu=4,
+    ignore=False,
+    deadline: typing.Optional[Deadline] = None,
+    executor: typing.Optional[concurrent.futures.Executor] = None,
 ):
+    if executor is not None:
+        # the risks run one after the other, each fanning its sweep out on executor
+        return single_worker_on_array(
+            app_config, risk_rewards, no_of_cpu, ignore, deadline, executor
+        )
     pairs = math.ceil(len(risk_rewards) / no_of_cpu)
     arrayPairs = group_in_pairs(risk_rewards, pairs)
     result = run_in_parallel(
-        single_worker_on_array,
-        [(app_config, x, no_of_cpu, ignore) for x in arrayPairs],
+        single_worker_on_array if ignore else with_disk_cache(single_worker_on_array),
+        [(app_config, x, no_of_cpu, ignore, deadline) for x in arrayPairs],
         no_of_cpu=no_of_cpu,
         ignore=ignore,
     )
@@ -376,14 +747,29 @@ def batch_resolver_generator(
     batchSize=10,
     no_of_cpu=4,
     ignore=False,
+    deadline: typing.Optional[Deadline] = None,
+    executor: typing.Optional[concurrent.futures.Executor] = None,
 ):
     first_value = app_config.risk_per_trade
     start = 0
     while True:
         first_batch = create_array(first_value, first_value + (batchSize * gap), gap)
         result = spawn_workers_on_array(
-            app_config, first_batch, no_of_cpu=no_of_cpu, ignore=ignore
+            app_config,
+            first_batch,
+            no_of_cpu=no_of_cpu,
+            ignore=ignore,
+            deadline=deadline,
+            executor=executor,
         )
+        if deadline and deadline.expired:
+            # the batch may be cut short, keep what it got to
+            valid = [x for x in result if x["size"] <= max_size]
+            if valid:
+                yield {**get_highest_value(valid), "partial": True}
+            elif start == 0 and result:
+                yield {**result[0], "partial": True}
+            break
         all_less_than_max = all([x["size"] <= max_size for x in result])
         if all_less_than_max:
             yield get_highest_value(result)
@@ -405,23 +791,190 @@ def consume_batch_generator(
     batchSize=10,
     no_of_cpu=4,
     ignore=False,
+    executor: InstanceExecutor = None,
+    deadline: typing.Optional[Deadline] = None,
 ):
     highest = None
     highest_arr = []
-    for r in batch_resolver_generator(
+    with instance_executor(executor, no_of_cpu) as pool:
+        for r in batch_resolver_generator(
+            app_config,
+            max_size,
+            gap=gap,
+            batchSize=batchSize,
+            no_of_cpu=no_of_cpu,
+            ignore=ignore,
+            deadline=deadline,
+            executor=pool,
+        ):
+            # highest = r
+            highest_arr.append(r)
+            logger.debug("size for %s %s", r["value"], r["size"])
+    if highest_arr:
+        highest = max(highest_arr, key=lambda x: x["size"])
+        if any(x.get("partial") for x in highest_arr):
+            highest = {**highest, "partial": True}
+    return highest
+
+
+def grid_risk(first_value: float, index: int, gap=1, batchSize=10) -> float:
+    """risk_per_trade at `index` of the values `batch_resolver_generator` walks,
+    built with the same additions so the floats match"""
+    value = first_value
+    for _ in range(index // batchSize):
+        value = value + batchSize * gap
+    for _ in range(index % batchSize):
+        value += gap
+    return value
+
+
+def search_optimum_risk(
+    app_config: AppConfig,
+    max_size: float,
+    gap=1,
+    batchSize=10,
+    tolerance: typing.Optional[float] = None,
+    no_of_cpu=4,
+    with_trades=False,
+    ignore=False,
+    executor: InstanceExecutor = None,
+    deadline: typing.Optional[Deadline] = None,
+) -> RiskType:
+    """`consume_batch_generator` through an exponential search and a scan.
+
+    Doubles the step from `app_config.risk_per_trade` until the size goes over
+    `max_size`. The size is a sawtooth rather than growing with the risk, so the
+    bracket isn't bisected: it is scanned every `tolerance` (one `gap` by default)
+    from the batch window of its lower end up to the end of the window the batches
+    stop in, and the largest size within `max_size` is picked, the first risk to
+    reach it on ties. With the default tolerance that is the risk the batches pick,
+    unless a risk skipped by the doubling already went over `max_size`; a larger
+    tolerance can miss the peak of a tooth. When `deadline` passes the best risk
+    resolved so far is returned, marked ``"partial"``.
+    """
+    steps = iter_search_optimum_risk(
         app_config,
         max_size,
         gap=gap,
         batchSize=batchSize,
+        tolerance=tolerance,
         no_of_cpu=no_of_cpu,
+        with_trades=with_trades,
         ignore=ignore,
-    ):
-        # highest = r
-        highest_arr.append(r)
-        print(f'size for {r["value"]} ', r["size"])
-    if highest_arr:
-        highest = max(highest_arr, key=lambda x: x["size"])
-    return highest
+        executor=executor,
+        deadline=deadline,
+    )
+    while True:
+        try:
+            next(steps)
+        except StopIteration as e:
+            return e.value
+
+
+def iter_search_optimum_risk(
+    app_config: AppConfig,
+    max_size: float,
+    gap=1,
+    batchSize=10,
+    tolerance: typing.Optional[float] = None,
+    no_of_cpu=4,
+    with_trades=False,
+    ignore=False,
+    executor: InstanceExecutor = None,
+    deadline: typing.Optional[Deadline] = None,
+) -> typing.Iterator[RiskType]:
+    """The steps of `search_optimum_risk`: yields each larger size found within
+    `max_size`, and returns the result of `search_optimum_risk`. That has the size of
+    the last step but may have a smaller risk, and is over `max_size` when even the
+    first risk is."""
+    with instance_executor(executor, no_of_cpu) as pool:
+        steps = _iter_search_optimum_risk(
+            app_config,
+            max_size,
+            gap,
+            batchSize,
+            tolerance,
+            no_of_cpu,
+            with_trades,
+            ignore,
+            pool,
+            deadline,
+        )
+        size = None
+        while True:
+            try:
+                result = next(steps)
+            except StopIteration as e:
+                return e.value
+            if result["size"] <= max_size and (size is None or result["size"] > size):
+                size = result["size"]
+                yield result
+
+
+def _iter_search_optimum_risk(
+    app_config: AppConfig,
+    max_size: float,
+    gap,
+    batchSize,
+    tolerance: typing.Optional[float],
+    no_of_cpu,
+    with_trades,
+    ignore,
+    executor: typing.Optional[concurrent.futures.Executor],
+    deadline: typing.Optional[Deadline],
+) -> typing.Iterator[RiskType]:
+    resolved = {}
+
+    def resolve(index):
+        if index not in resolved:
+            resolved[index] = size_resolver(
+                grid_risk(app_config.risk_per_trade, index, gap, batchSize),
+                app_config,
+                no_of_cpu=no_of_cpu,
+                with_trades=with_trades,
+                ignore=ignore,
+                executor=executor,
+                deadline=deadline,
+            )
+        if resolved[index].get("partial"):
+            raise TimeoutException()
+        return resolved[index]
+
+    def fits(index):
+        return resolve(index)["size"] <= max_size
+
+    try:
+        yield resolve(0)
+        if not fits(0):
+            return resolve(0)
+        low, high = 0, 1
+        while fits(high):
+            low, high = high, high * 2
+            yield resolve(low)
+        steps = max(1, int((tolerance or gap) / gap + 1e-9))
+        index = low // batchSize * batchSize
+        while index < high and fits(index):
+            yield resolve(index)
+            index += steps
+        # like the batches, finish the window holding the first size over max_size
+        over = min(index, high)
+        end = max(batchSize, math.ceil(over / batchSize) * batchSize)
+        for index in range(over + steps, end + 1, steps):
+            yield resolve(index)
+        valid = [
+            resolved[x]
+            for x in sorted(resolved)
+            if x <= end and resolved[x]["size"] <= max_size
+        ]
+        return get_highest_value(valid)
+    except TimeoutException:
+        if 0 not in resolved:
+            raise
+        valid = [
+            resolved[x] for x in sorted(resolved) if resolved[x]["size"] <= max_size
+        ]
+        best = get_highest_value(valid) if valid else resolved[0]
+        return {**best, "partial": True}
 
 
 def determine_optimum_risk(
@@ -432,7 +985,28 @@ def determine_optimum_risk(
     no_of_cpu=4,
     with_trades=False,
     ignore=False,
+    search=False,
+    tolerance: typing.Optional[float] = None,
+    executor: InstanceExecutor = None,
+    deadline: typing.Optional[Deadline] = None,
 ) -> typing.Optional[RiskType]:
+    """Largest risk_per_trade whose optimum size stays within `max_size`. The sweep of
+    each risk runs on `executor` when given, opened once for the whole call. Pass a
+    `Deadline` to bound the time spent, the result is then marked ``"partial"``
+    when it ran out before the search finished."""
+    if search:
+        return search_optimum_risk(
+            app_config,
+            max_size,
+            gap=gap,
+            batchSize=multiplier,
+            tolerance=tolerance,
+            no_of_cpu=no_of_cpu,
+            with_trades=with_trades,
+            ignore=ignore,
+            executor=executor,
+            deadline=deadline,
+        )
     return consume_batch_generator(
         app_config,
         max_size,
@@ -440,78 +1014,294 @@ def determine_optimum_risk(
         batchSize=multiplier,
         no_of_cpu=no_of_cpu,
         ignore=ignore,
+        executor=executor,
+        deadline=deadline,
     )
-    start_index = 0
-    # highest = {
-    #     "value": app_config.risk_per_trade,
-    #     "risk_reward": app_config.risk_reward,
-    #     "size": max_size,
-    # }
-    highest = None
-    print("max_size", max_size)
-    # first = app_config.risk_per_trade + (gap * start_index)
-    # result = size_resolver(first, app_config, no_of_cpu=no_of_cpu)
-    # print("result", result)
-    results = []
+
+
+class OptimumCandidate(typing.TypedDict):
+    value: float
+    risk_reward: float
+    size: float
+    elapsed: float
+
+
+def coarse_to_fine(count: int, step=8) -> typing.Iterator[typing.List[int]]:
+    """Indices `0..count-1` in rounds: every `step`-th and the last one, then the
+    ones halfway between, until the step is 1"""
+    seen = set()
+    while step >= 1:
+        indices = [
+            i
+            for i in dict.fromkeys([*range(0, count, step), count - 1])
+            if i not in seen
+        ]
+        seen.update(indices)
+        if indices:
+            yield indices
+        step //= 2
+
+
+def iter_optimum_reward(
+    app_config: AppConfig,
+    no_of_cpu=4,
+    gap=1,
+    loss=None,
+    increase=None,
+    step=8,
+    executor: InstanceExecutor = None,
+    deadline: typing.Optional[Deadline] = None,
+) -> typing.Iterator[OptimumCandidate]:
+    """Anytime version of `determine_optimum_reward`.
+
+    Evaluates the risk_reward values coarse to fine, see `coarse_to_fine`, and yields
+    the pick over the values evaluated so far each time it beats the last one yielded
+    on size, then on net_diff; stop iterating to keep the best so far. Once every
+    value is evaluated the last candidate is what `determine_optimum_reward` picks,
+    yielded even when it doesn't beat the one before. Ends early once `deadline`
+    passes.
+    """
+    start = time.monotonic()
+    risk_rewards = [x for x in range(30, 199, gap)]
+    evaluated = {}
+    quality = None
+    candidate = None
+    with instance_executor(executor, no_of_cpu) as pool:
+        for indices in coarse_to_fine(len(risk_rewards), step):
+            values = [risk_rewards[i] for i in indices]
+            evaluated.update(
+                eval_risk_rewards(
+                    values,
+                    app_config,
+                    increase=increase,
+                    executor=pool,
+                    no_of_cpu=no_of_cpu,
+                    deadline=deadline,
+                    summary=True,
+                )
+            )
+            func = [evaluated[x] for x in risk_rewards if x in evaluated]
+            optimum = pick_optimum_reward(func, app_config, loss=loss)
+            if optimum:
+                net_diff = optimum["neg.pnl"] + optimum["risk_per_trade"]
+                better = (optimum["total"], net_diff)
+            complete = len(evaluated) == len(risk_rewards)
+            if optimum and (
+                quality is None
+                or better > quality
+                # converge on the full scan
+                or (complete and optimum["value"] != candidate["risk_reward"])
+            ):
+                quality = better
+                candidate = {
+                    "value": app_config.risk_per_trade,
+                    "risk_reward": optimum["value"],
+                    "size": optimum["total"],
+                    "elapsed": time.monotonic() - start,
+                }
+                yield candidate
+            if any(x not in evaluated for x in values):
+                return
+
+
+def iter_optimum_risk(
+    app_config: AppConfig,
+    max_size: float,
+    gap: float = 1,
+    multiplier=10,
+    no_of_cpu=4,
+    tolerance: typing.Optional[float] = None,
+    executor: InstanceExecutor = None,
+    deadline: typing.Optional[Deadline] = None,
+) -> typing.Iterator[OptimumCandidate]:
+    """Anytime version of `determine_optimum_risk` with `search` set, yields each
+    larger size found within `max_size`. The last candidate is what it returns: the
+    first risk at the best size, the result marked ``"partial"`` when `deadline`
+    passes, or the first risk when even that is over `max_size`."""
+    start = time.monotonic()
+    steps = iter_search_optimum_risk(
+        app_config,
+        max_size,
+        gap=gap,
+        batchSize=multiplier,
+        tolerance=tolerance,
+        no_of_cpu=no_of_cpu,
+        executor=executor,
+        deadline=deadline,
+    )
+    last = None
     while True:
-        current_risk = app_config.risk_per_trade + (2 ** (gap * start_index))
         try:
-            signal.alarm(60)
-            result = size_resolver(
-                current_risk,
+            last = next(steps)
+        except StopIteration as e:
+            if e.value is not None and e.value != last:
+                yield {**e.value, "elapsed": time.monotonic() - start}
+            return
+        yield {**last, "elapsed": time.monotonic() - start}
+
+
+async def in_executor(
+    iterator: typing.Iterator[typing.Any],
+) -> typing.AsyncIterator[typing.Any]:
+    """Steps `iterator` on the default executor of the running loop. Cancelled in the
+    middle of a step, it waits for that step to finish before closing `iterator`."""
+    loop = asyncio.get_running_loop()
+    done = object()
+    stepping = threading.Lock()
+
+    def step():
+        with stepping:
+            return next(iterator, done)
+
+    try:
+        while True:
+            item = await loop.run_in_executor(None, step)
+            if item is done:
+                return
+            yield item
+    finally:
+        # a generator can't be closed while it runs on the thread
+        if not stepping.acquire(blocking=False):
+            await loop.run_in_executor(None, stepping.acquire)
+        try:
+            if hasattr(iterator, "close"):
+                iterator.close()
+        finally:
+            stepping.release()
+
+
+def aiter_optimum_reward(*args, **kwargs) -> typing.AsyncIterator[OptimumCandidate]:
+    """`iter_optimum_reward` as an async iterator"""
+    return in_executor(iter_optimum_reward(*args, **kwargs))
+
+
+def aiter_optimum_risk(*args, **kwargs) -> typing.AsyncIterator[OptimumCandidate]:
+    """`iter_optimum_risk` as an async iterator"""
+    return in_executor(iter_optimum_risk(*args, **kwargs))
+
+
+def optimise_zone_sync(
+    app_config: AppConfig,
+    zone: dict,
+    gap: float = 1,
+    with_trades=False,
+    search=False,
+    tolerance: typing.Optional[float] = None,
+    deadline: typing.Optional[Deadline] = None,
+    max_size: typing.Optional[float] = None,
+) -> typing.Optional[RiskType]:
+    """`determine_optimum_risk` of one zone (entry, stop, an optional size and gap)
+    in the calling process, `max_size` bounds zones without a size"""
+    app_config = replace(app_config, entry=zone["entry"], stop=zone["stop"])
+    return determine_optimum_risk(
+        app_config,
+        zone.get("size") or max_size,
+        gap=zone.get("gap") or gap,
+        with_trades=with_trades,
+        # the zones are spread over the workers, each one runs serially
+        ignore=True,
+        search=search,
+        tolerance=tolerance,
+        deadline=deadline,
+    )
+
+
+async def optimise_zone(
+    app_config: AppConfig,
+    zone: dict,
+    gap: float = 1,
+    with_trades=False,
+    search=False,
+    tolerance: typing.Optional[float] = None,
+    timeout: typing.Optional[float] = None,
+    executor: typing.Optional[concurrent.futures.Executor] = None,
+    max_size: typing.Optional[float] = None,
+) -> typing.Optional[RiskType]:
+    """`optimise_zone_sync` on `executor`, the default executor of the loop when
+    None. `timeout` bounds it through a `Deadline`. Cancelling the task drops a zone
+    that hasn't started and stops one running on a thread at its next evaluation, a
+    process worker carries on until its deadline."""
+    deadline = Deadline(timeout)
+    loop = asyncio.get_running_loop()
+    task = optimise_zone_sync
+    if isinstance(executor, concurrent.futures.ProcessPoolExecutor):
+        task = with_disk_cache(optimise_zone_sync)
+    future = loop.run_in_executor(
+        executor,
+        task,
+        app_config,
+        zone,
+        gap,
+        with_trades,
+        search,
+        tolerance,
+        deadline,
+        max_size,
+    )
+    try:
+        return await future
+    except asyncio.CancelledError:
+        deadline.cancel()
+        raise
+
+
+async def optimise_zones(
+    app_config: AppConfig,
+    zones: typing.List[dict],
+    gap: float = 1,
+    with_trades=False,
+    no_of_cpu=4,
+    max_concurrent: typing.Optional[int] = None,
+    timeout: typing.Optional[float] = None,
+    executor: InstanceExecutor = "process",
+    search=False,
+    tolerance: typing.Optional[float] = None,
+    max_size: typing.Optional[float] = None,
+) -> typing.List[typing.Optional[RiskType]]:
+    """`determine_optimum_risk` of every zone without blocking the event loop.
+
+    The zones run on `executor`: "process" (the default) uses the shared process
+    executor with `no_of_cpu` workers, see `get_process_executor`, "thread" opens a
+    pool of `no_of_cpu` threads for the call, an executor is used as is and None
+    uses the default executor of the loop. At most `max_concurrent` zones
+    (`no_of_cpu` by default) are in flight, and each is bounded by `timeout` like
+    `optimise_zone`. Zones without a size are bounded by `max_size`. Results come
+    back in the order of `zones`; cancelling the call cancels the zones still
+    waiting.
+    """
+    owned = executor == "thread"
+    if owned:
+        pool = concurrent.futures.ThreadPoolExecutor(max_workers=no_of_cpu)
+    elif executor == "process":
+        # kept between calls, so regenerating doesn't start and import workers again
+        pool = get_process_executor(no_of_cpu)
+    else:
+        pool = executor
+    semaphore = asyncio.Semaphore(max_concurrent or no_of_cpu)
+
+    async def run(zone):
+        async with semaphore:
+            return await optimise_zone(
                 app_config,
-                no_of_cpu=no_of_cpu,
+                zone,
+                gap=gap,
                 with_trades=with_trades,
-                ignore=ignore,
-            )
-        except Exception as e:
-            print(
-                "payload",
-                {
-                    "current_risk": current_risk,
-                    "app_config": app_config,
-                    "no_of_cpu": no_of_cpu,
-                    "with_trades": with_trades,
-                    "ignore": ignore,
-                },
+                search=search,
+                tolerance=tolerance,
+                timeout=timeout,
+                executor=pool,
+                max_size=max_size,
             )
-            print("error", e)
-            signal.alarm(0)
-            result = {"size": 0, "value": current_risk, "risk_reward": 0, "trades": []}
-            raise e
-        size = to_f(result["size"], app_config.decimal_places)
-        if size <= max_size:
-            print(f"size for risk {current_risk}", size)
-            results.append(result)
-            # update = result
-            # previous = highest.get("value", 0) if highest else current_risk
-            # if highest and previous == highest["value"]:
-            #     update = highest
-            # highest = {
-            #     **update,
-            #     "risk_reward": result["risk_reward"],
-            #     "size": size,
-            #     "value": max(previous, current_risk),
-            # }
-            # yield result
-            start_index += 1
-        else:
-            # print(f"size for risk {current_risk}", size)
-            # update = result
-            # previous = highest.get("value", 0) if highest else current_risk
-            # if highest and previous == highest["value"]:
-            #     update = highest
-            # highest = {
-            #     **update,
-            #     "risk_reward": result["risk_reward"],
-            #     "size": size,
-            #     "value": max(previous, current_risk),
-            # }
-            break
-    if results:
-        return max(results, key=lambda x: x["size"])
-    return result
-    return highest
+
+    tasks = [asyncio.ensure_future(run(x)) for x in zones]
+    try:
+        return await asyncio.gather(*tasks)
+    finally:
+        for task in tasks:
+            task.cancel()
+        if owned:
+            # don't hold the loop for threads still finishing a cancelled zone
+            pool.shutdown(wait=False, cancel_futures=True)
 
 
 def get_highest(
@@ -535,9 +1325,7 @@ def float_range(start: float, stop: float, step: float):
 
 
 def entry_resolver(stop: float, app_config: AppConfig):
-    app_config.stop = stop
-    app_config.raw = True
-    app_config.strategy = "entry"
+    app_config = replace(app_config, stop=stop, raw=True, strategy="entry")
     return determine_optimum_reward(app_config, no_of_cpu=4)
 
 
@@ -1,6 +1,147 @@
+import atexit
 import concurrent.futures
+import importlib
+import os
+import threading
 import typing
+import weakref
 import multiprocessing
+import multiprocessing.pool
+
+# modules each worker imports once when it starts, so tasks don't pay for it
+WORKER_MODULES = (
+    "enhanced_lib.calculations.future_config",
+    "enhanced_lib.calculations.workers.optimum_risk_reward",
+)
+
+
+def import_modules(modules: typing.Iterable[str] = WORKER_MODULES):
+    for module in modules:
+        importlib.import_module(module)
+
+
+class WorkerPool:
+    """A `multiprocessing.Pool` that is started on first use and kept for later calls.
+
+    Pools are forked lazily, so they carry the state of the parent at that time and
+    `close` has to be called (or the process exit) to stop the workers. Safe to use
+    from several threads at once.
+    """
+
+    _instances: "weakref.WeakSet[WorkerPool]" = weakref.WeakSet()
+
+    def __init__(
+        self,
+        processes: int = 4,
+        initializer: typing.Optional[typing.Callable] = import_modules,
+        initargs: typing.Tuple = (),
+    ):
+        self.processes = processes
+        self.initializer = initializer
+        self.initargs = initargs
+        self._pool: typing.Optional[multiprocessing.pool.Pool] = None
+        self._pid: typing.Optional[int] = None
+        self._lock = threading.Lock()
+        WorkerPool._instances.add(self)
+
+    @property
+    def started(self) -> bool:
+        return self._pool is not None and self._pid == os.getpid()
+
+    @property
+    def pool(self) -> multiprocessing.pool.Pool:
+        with self._lock:
+            # a forked child can't use the pool of its parent
+            if not self.started:
+                self._pool = multiprocessing.Pool(
+                    processes=self.processes,
+                    initializer=self.initializer,
+                    initargs=self.initargs,
+                )
+                self._pid = os.getpid()
+            return self._pool
+
+    def starmap(self, func, args):
+        return self.pool.starmap(func, args)
+
+    def map(self, func, args, chunksize=None):
+        return self.pool.map(func, args, chunksize)
+
+    def close(self):
+        with self._lock:
+            if self.started:
+                self._pool.close()
+                self._pool.join()
+            self._pool = None
+            self._pid = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+_pools: typing.Dict[int, WorkerPool] = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(no_of_cpu=4) -> WorkerPool:
+    """The shared pool with `no_of_cpu` workers, created on first request"""
+    with _pools_lock:
+        if no_of_cpu not in _pools:
+            _pools[no_of_cpu] = WorkerPool(no_of_cpu)
+        return _pools[no_of_cpu]
+
+
+_executors: typing.Dict[
+    int, typing.Tuple[int, concurrent.futures.ProcessPoolExecutor]
+] = {}
+
+
+def get_process_executor(no_of_cpu=4) -> concurrent.futures.ProcessPoolExecutor:
+    """The shared `ProcessPoolExecutor` with `no_of_cpu` workers, for callers that
+    need futures (e.g. asyncio). Created on first request and kept like `get_pool`,
+    its workers import `WORKER_MODULES` when they start."""
+    with _pools_lock:
+        pid, executor = _executors.get(no_of_cpu, (None, None))
+        # a forked child can't use the executor of its parent
+        if pid != os.getpid():
+            executor = concurrent.futures.ProcessPoolExecutor(
+                max_workers=no_of_cpu, initializer=import_modules
+            )
+            _executors[no_of_cpu] = (os.getpid(), executor)
+        return executor
+
+
+def shutdown_pools():
+    """Stop the workers of every shared pool and executor, they start again when
+    next used"""
+    with _pools_lock:
+        pools = list(_pools.values())
+        _pools.clear()
+        executors = [x for pid, x in _executors.values() if pid == os.getpid()]
+        _executors.clear()
+    for pool in pools:
+        pool.close()
+    for executor in executors:
+        executor.shutdown(cancel_futures=True)
+
+
+atexit.register(shutdown_pools)
+
+
+def _reset_locks():
+    # a child forked while a lock was held, e.g. by `pool` starting its own workers,
+    # would otherwise wait on it forever
+    global _pools_lock
+    _pools_lock = threading.Lock()
+    for pool in list(WorkerPool._instances):
+        pool._lock = threading.Lock()
+
+
+os.register_at_fork(after_in_child=_reset_locks)
+
 
 def generator(func, args):
     for arg in args:
@@ -37,11 +178,11 @@ def run_in_parallel(
     args: typing.List[typing.Tuple[int, typing.Any]],
     no_of_cpu=4,
     ignore=False,
+    pool: typing.Optional[WorkerPool] = None,
 ):
     if ignore:
         return [func(*x) for x in args]
-    with multiprocessing.Pool(processes=no_of_cpu) as p:
-        return p.starmap(func, args)
+    return (pool or get_pool(no_of_cpu)).starmap(func, args)
 
 
 def chunks_in_threads(
@@ -50,11 +191,13 @@ def chunks_in_threads(
     num_threads=2,
     no_of_cpu=4,
 ):
+    # the threads share one pool instead of starting one each
+    pool = get_pool(no_of_cpu)
     # Split the args into chunks
     chunks = [args[i : i + num_threads] for i in range(0, len(args), num_threads)]
 
     def use_multiprocess(_args):
-        return run_in_parallel(func, _args, no_of_cpu=no_of_cpu)
+        return run_in_parallel(func, _args, pool=pool)
 
     # Run each chunk in a separate thread
     result = run_in_threads(
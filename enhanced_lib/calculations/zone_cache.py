@@ -0,0 +1,65 @@
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Hashable, Optional
+
+
+class ZoneCache:
+    """Bounded LRU cache of zone lookups shared by every Signal in the process.
+
+    Keys hold the name of the lookup, the Signal fields it reads and its arguments, so
+    signals that only differ in fields the lookup ignores share the same entries.
+    Values are stored as given; callers store immutable values.
+    """
+
+    def __init__(self, maxsize: int = 8192):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._data: "OrderedDict[Hashable, Any]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable, compute: Callable[[], Any]) -> Any:
+        with self._lock:
+            if key in self._data:
+                self._data.move_to_end(key)
+                self.hits += 1
+                return self._data[key]
+            self.misses += 1
+        value = compute()
+        with self._lock:
+            self._data[key] = value
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+        return value
+
+    def invalidate(self, focus: Optional[float] = None):
+        """Drop every entry, or only the ones computed for `focus`"""
+        with self._lock:
+            if focus is None:
+                self._data.clear()
+            else:
+                for key in [x for x in self._data if x[1] == focus]:
+                    del self._data[key]
+
+    def resize(self, maxsize: int):
+        with self._lock:
+            self.maxsize = maxsize
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def info(self) -> dict:
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "size": len(self._data),
+                "maxsize": self.maxsize,
+            }
+
+    def reset_stats(self):
+        with self._lock:
+            self.hits = 0
+            self.misses = 0
+
+
+zone_cache = ZoneCache()
@@ -1,7 +1,9 @@
 from dataclasses import dataclass
+import logging
 import typing
 from ..calculations.workers.utils import chunks_in_threads, run_in_threads
-from ..calculations.workers import determine_optimum_reward
+from ..calculations.workers import determine_optimum_reward, optimise_zones
+from ..calculations.trade_signal import InstanceExecutor
 
 from ..calculations.future_config import (
     Config,
@@ -14,6 +16,8 @@ from .account import Account, AccountKeys
 from .types import ExchangeInfo, OrderControl, Position, PositionKlass, PositionKind
 from ..calculations.utils import determine_entry_and_size, determine_position_size
 
+logger = logging.getLogger(__name__)
+
 
 @dataclass
 class ExchangeCache:
@@ -388,6 +392,57 @@ class ExchangeCache:
 
         return result
 
+    async def config_params_for_future_trades_async(
+        self,
+        kind: Position,
+        with_trades=False,
+        no_of_cpu=6,
+        gap=None,
+        full=False,
+        executor: InstanceExecutor = "process",
+        max_concurrent=None,
+        timeout=None,
+    ):
+        """`config_params_for_future_trades` on `optimise_zones`, so the event loop
+        keeps running while the zones are optimised. Zones cut short by `timeout` are
+        marked ``"partial"``, zones without any risk found are left out."""
+        zones = self.get_next_tradable_zone(kind, full=full)
+        config = self.future_instance.config
+        config.kind = kind
+
+        def get_gap(x: shared.TradingZoneDict):
+            if gap:
+                return gap
+            if x.get("size") < 0.15:
+                return 0.1
+            return 1
+
+        result = await optimise_zones(
+            config.app_config,
+            [{**x, "gap": get_gap(x)} for x in zones],
+            with_trades=with_trades,
+            no_of_cpu=no_of_cpu,
+            max_concurrent=max_concurrent,
+            timeout=timeout,
+            executor=executor,
+            max_size=config.max_size,
+        )
+        params = []
+        for o, y in zip(zones, result):
+            if not y:
+                logger.warning("no risk found for %s zone %s", kind, o)
+                continue
+            params.append(
+                {
+                    **o,
+                    "risk_reward": y["risk_reward"],
+                    "risk_per_trade": y["value"],
+                    "trades": y.get("trades", []),
+                    "partial": bool(y.get("partial")),
+                }
+            )
+        return params
+
     def config_params_for_future_trades2(
         self, kind: Position, with_trades=False, no_of_cpu=6
     ):
@@ -1,5 +1,6 @@
 import logging
 import os
+import warnings
 from dataclasses import dataclass
 from typing import Literal, TypedDict, List
 
@@ -88,6 +89,52 @@ class Database:
         )
         self.started_generation = False
 
+    async def generate_future_trades_async(
+        self,
+        exchange: ExchangeCache,
+        kind=None,
+        full=None,
+        no_of_cpu=4,
+        executor="process",
+        max_concurrent=None,
+        timeout=None,
+    ):
+        """`generate_future_trades` without blocking the event loop, the zones are
+        optimised on `executor` (see `optimise_zones`). With a `timeout` the trades of
+        zones that ran out of time are marked ``"partial"``."""
+        self.started_generation = True
+        existing = self.get_future_trades(exchange.account.owner, exchange.symbol)
+        long_trades = existing.get("long") or []
+        short_trades = existing.get("short") or []
+        gap = exchange.config.gap or 1
+        params = {
+            "gap": gap,
+            "full": full,
+            "no_of_cpu": no_of_cpu,
+            "executor": executor,
+            "max_concurrent": max_concurrent,
+            "timeout": timeout,
+        }
+        try:
+            if kind == "long" or not kind:
+                long_trades = await exchange.config_params_for_future_trades_async(
+                    "long", True, **params
+                )
+            if kind == "short" or not kind:
+                short_trades = await exchange.config_params_for_future_trades_async(
+                    "short", True, **params
+                )
+            self.save_future_trades(
+                exchange.account.owner,
+                exchange.symbol,
+                {
+                    "long": long_trades,
+                    "short": short_trades,
+                },
+            )
+        finally:
+            self.started_generation = False
+
     def get_trades_for_entry(
         self, owner: str, symbol: str, payload: TradeZoneDict, places="%.1f"
     ):
@@ -172,21 +219,24 @@ class Database:
         return ExchangeCache(account, symbol)
 
     async def generate_and_save_future_trades(
-        self, owner: str, symbol: str, config_owner=None, no_of_cpu=4, ignore=True
+        self, owner: str, symbol: str, config_owner=None, no_of_cpu=4, ignore=None
     ):
+        if ignore is not None:
+            warnings.warn(
+                "ignore has no effect, the zones are optimised on worker processes",
+                DeprecationWarning,
+                stacklevel=2,
+            )
         exchange: ExchangeCache = await self.get_initialized_exchange(
             owner,
             symbol,
             owner_config=config_owner,
         )
-        # with concurrent.futures.ThreadPoolExecutor() as executor:
-        #     loop.run_in_executor(executor,self.generate_future_trades,,
-        self.generate_future_trades(
+        await self.generate_future_trades_async(
             exchange,
             kind=None,
             full=True,
             no_of_cpu=no_of_cpu,
-            ignore=ignore,
         )
         print("Generated trades")
         print("result", self.get_trade_zones(owner, symbol))
@@ -0,0 +1,97 @@
+import random
+
+import numpy as np
+import pytest
+
+from enhanced_lib.calculations import kernels
+from enhanced_lib.calculations.utils import (
+    determine_avg,
+    determine_close_price,
+    determine_pnl,
+    determine_position_size,
+    determine_stop_and_size,
+)
+
+modes = [False] + ([True] if kernels.HAS_NUMBA else [])
+
+
+@pytest.fixture(params=modes, ids=lambda x: "numba" if x else "python")
+def use_numba(request, monkeypatch):
+    monkeypatch.setattr(kernels, "use_numba", request.param)
+    return request.param
+
+
+@pytest.fixture
+def ladder():
+    rnd = random.Random(7)
+    entries = [round(67629.3 * (1 - 0.003 * i), 1) for i in range(60)]
+    stops = [round(x * rnd.uniform(0.95, 1.05), 1) for x in entries]
+    quantities = [round(rnd.uniform(0.001, 0.5), 3) for _ in entries]
+    return entries, stops, quantities
+
+
+@pytest.mark.parametrize("kind", ["long", "short"])
+def test_pnls_match_scalar(use_numba, ladder, kind):
+    entries, stops, quantities = ladder
+    for contract_size in [None, 100]:
+        result = kernels.determine_pnls(
+            entries, stops, quantities, kind=kind, contract_size=contract_size
+        )
+        assert result.tolist() == [
+            determine_pnl(*x, kind=kind, contract_size=contract_size)
+            for x in zip(entries, stops, quantities)
+        ]
+
+
+@pytest.mark.parametrize("min_size", [None, 0.004, 1])
+def test_position_sizes_match_scalar(use_numba, ladder, min_size):
+    entries, stops, _ = ladder
+    stops = stops[:-1] + [0]
+    for places in ["%.3f", "%.0f"]:
+        result = kernels.determine_position_sizes(
+            entries, stops, 20, percent=0.02, min_size=min_size, places=places
+        )
+        assert result.tolist() == [
+            determine_position_size(
+                x, y, 20, percent=0.02, min_size=min_size, places=places
+            )
+            for x, y in zip(entries, stops)
+        ]
+    assert np.isnan(kernels.determine_position_sizes(entries, 0, 20)).all()
+
+
+@pytest.mark.parametrize("kind", ["long", "short"])
+def test_close_prices_and_stop_sizes_match_scalar(use_numba, ladder, kind):
+    entries, stops, quantities = ladder
+    quantities = quantities[:-1] + [0]
+    pnls = [x * 3.5 for x in quantities]
+    assert kernels.determine_close_prices(
+        entries, pnls, quantities, leverage=2, kind=kind
+    ).tolist() == [
+        determine_close_price(*x, leverage=2, kind=kind)
+        for x in zip(entries, pnls, quantities)
+    ]
+    assert kernels.determine_stop_and_sizes(
+        entries, pnls, stops, kind=kind
+    ).tolist() == [
+        determine_stop_and_size(*x, kind=kind) for x in zip(entries, pnls, stops)
+    ]
+    with pytest.raises(ZeroDivisionError):
+        kernels.determine_stop_and_sizes(entries, pnls, entries)
+
+
+def test_avgs_match_scalar(use_numba, ladder):
+    entries, _, quantities = ladder
+    orders = [{"price": x, "quantity": y} for x, y in zip(entries, quantities)]
+    prices, sizes = kernels.determine_running_avgs(entries, quantities)
+    for i in range(len(orders)):
+        expected = determine_avg(orders[: i + 1])
+        assert (prices[i], sizes[i]) == (expected["price"], expected["quantity"])
+    for places in [("%.3f", "%.1f"), ("%.0f", "%.4f")]:
+        assert kernels.determine_avgs(entries, quantities, *places) == determine_avg(
+            orders, *places
+        )
+    assert kernels.determine_avgs([], []) == determine_avg([])
+    assert kernels.determine_avgs([100.0], [0]) == determine_avg(
+        [{"price": 100.0, "quantity": 0}]
+    )
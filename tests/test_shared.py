@@ -1,5 +1,12 @@
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import replace
+
 import pytest
+from enhanced_lib.calculations import disk_cache
 from enhanced_lib.calculations.shared import AppConfig, build_config
+from enhanced_lib.calculations.workers import optimum_risk_reward, utils
 
 
 @pytest.fixture
@@ -28,6 +35,17 @@ def app_config():
     )
 
 
+@pytest.fixture
+def raw_config(app_config: AppConfig):
+    return replace(app_config, raw=True)
+
+
+@pytest.fixture
+def risk_config(app_config: AppConfig):
+    # the smaller min_size lets every risk of the search resolve
+    return replace(app_config, min_size=0.001)
+
+
 def test_build_config(app_config: AppConfig):
     param_type = {
         "take_profit": app_config.entry,
@@ -66,3 +84,413 @@ def test_build_config(app_config: AppConfig):
             "stop_percent": 0.002,
         },
     ]
+
+
+def test_optimum_reward_search_matches_scan(raw_config: AppConfig, monkeypatch):
+    expected = optimum_risk_reward.determine_optimum_reward(raw_config)
+    evaluated = []
+    eval_func = optimum_risk_reward.eval_func
+
+    def counted(y, *args, **kwargs):
+        evaluated.append(y)
+        return eval_func(y, *args, **kwargs)
+
+    monkeypatch.setattr(optimum_risk_reward, "eval_func", counted)
+    result = optimum_risk_reward.determine_optimum_reward(raw_config, search=True)
+    assert result["value"] == expected["value"]
+    assert result["total"] == expected["total"]
+    assert len(evaluated) < 60
+    evaluated.clear()
+    result = optimum_risk_reward.determine_optimum_reward(
+        raw_config, search=True, verify=True
+    )
+    assert result["value"] == expected["value"]
+    # the full scan reuses what the search already evaluated
+    assert sorted(evaluated) == list(range(30, 199))
+
+
+@pytest.mark.parametrize("executor", ["thread", "process"])
+@pytest.mark.parametrize("search", [False, True])
+def test_optimum_reward_on_executor(raw_config: AppConfig, search, executor):
+    expected = optimum_risk_reward.determine_optimum_reward(raw_config, search=search)
+    # process workers only send back summaries, the trades are rebuilt
+    result = optimum_risk_reward.determine_optimum_reward(
+        raw_config, search=search, executor=executor, no_of_cpu=3
+    )
+    assert result == expected
+
+
+@pytest.mark.parametrize("summary", [False, True])
+def test_eval_risk_rewards_summary(raw_config: AppConfig, summary):
+    values = list(range(30, 40))
+    expected = optimum_risk_reward.eval_risk_rewards(
+        values, raw_config, summary=summary
+    )
+    with ThreadPoolExecutor(2) as pool:
+        result = optimum_risk_reward.eval_risk_rewards(
+            values, raw_config, executor=pool, no_of_cpu=2, summary=summary
+        )
+    assert result == expected
+    assert isinstance(result[30]["result"], int if summary else list)
+
+
+def test_optimum_risk_search_matches_batches(risk_config: AppConfig):
+    expected = optimum_risk_reward.determine_optimum_risk(
+        risk_config, 0.011, gap=2, multiplier=4, ignore=True
+    )
+    result = optimum_risk_reward.determine_optimum_risk(
+        risk_config, 0.011, gap=2, multiplier=4, ignore=True, search=True
+    )
+    assert result == expected
+    result = optimum_risk_reward.determine_optimum_risk(
+        risk_config, 0.011, gap=2, multiplier=4, ignore=True, search=True, tolerance=6
+    )
+    assert result["size"] <= 0.011
+    assert expected["value"] - 6 <= result["value"] <= expected["value"]
+
+
+def test_optimum_risk_search_sawtooth(risk_config: AppConfig, monkeypatch):
+    # sizes aren't monotone in the risk: the peak within max_size sits before a dip
+    sizes = [5, 7, 9, 12, 14, 16, 18, 20, 22, 24, 26, 23, 31, 29, 28, 30]
+    sizes += [33 + x for x in range(40)]
+    resolved = []
+
+    def size_resolver(trade_no, app_config, **kwargs):
+        resolved.append(trade_no)
+        index = round((trade_no - app_config.risk_per_trade) / 0.5)
+        return {"value": trade_no, "risk_reward": 100, "size": sizes[index] / 1000}
+
+    monkeypatch.setattr(optimum_risk_reward, "size_resolver", size_resolver)
+    params = dict(gap=0.5, multiplier=4, ignore=True)
+    expected = optimum_risk_reward.determine_optimum_risk(risk_config, 0.03, **params)
+    assert expected["size"] == 0.026
+    batches = len(set(resolved))
+    resolved.clear()
+    result = optimum_risk_reward.determine_optimum_risk(
+        risk_config, 0.03, search=True, **params
+    )
+    assert result == expected
+    assert len(set(resolved)) <= batches
+
+
+@pytest.mark.parametrize("search", [False, True])
+def test_optimum_risk_on_executor(risk_config: AppConfig, monkeypatch, search):
+    expected = optimum_risk_reward.determine_optimum_risk(
+        risk_config, 0.003, gap=2, multiplier=4, ignore=True, search=search
+    )
+    opened = []
+
+    class Pool(ThreadPoolExecutor):
+        def __init__(self, *args, **kwargs):
+            opened.append(self)
+            super().__init__(*args, **kwargs)
+
+    monkeypatch.setattr(
+        optimum_risk_reward.concurrent.futures, "ThreadPoolExecutor", Pool
+    )
+    result = optimum_risk_reward.determine_optimum_risk(
+        risk_config, 0.003, gap=2, multiplier=4, search=search, executor="thread"
+    )
+    assert result == expected
+    # one pool for every risk resolved
+    assert len(opened) == 1
+
+
+def test_optimum_reward_disk_cache(raw_config: AppConfig, tmp_path):
+    expected = optimum_risk_reward.determine_optimum_reward(raw_config)
+    path = str(tmp_path / "results.sqlite")
+    try:
+        cache = disk_cache.enable_disk_cache(path)
+        assert optimum_risk_reward.determine_optimum_reward(raw_config) == expected
+        assert cache.info()["hits"] == 0
+        # a new process reads what the first one stored
+        cache = disk_cache.enable_disk_cache(path)
+        assert optimum_risk_reward.determine_optimum_reward(raw_config) == expected
+        info = cache.info()
+        assert info["misses"] == 0
+        assert info["hit_rate"] == 1
+        assert info["size"] == 169
+        # another release doesn't see the results of this one
+        cache = disk_cache.enable_disk_cache(path, maxsize=50, version="other")
+        assert optimum_risk_reward.determine_optimum_reward(raw_config) == expected
+        assert cache.info()["hits"] == 0
+        cache.evict()
+        assert cache.info()["size"] == 50
+    finally:
+        disk_cache.disable_disk_cache()
+
+
+def test_disk_cache_reaches_running_workers(raw_config: AppConfig, tmp_path):
+    executor = utils.get_process_executor(2)
+    # start the workers before the cache is enabled
+    assert executor.submit(int, "1").result() == 1
+    try:
+        cache = disk_cache.enable_disk_cache(str(tmp_path / "results.sqlite"))
+        optimum_risk_reward.determine_optimum_reward(raw_config, executor=executor)
+        assert cache.info()["size"] == 169
+        disk_cache.disable_disk_cache()
+        cache.clear()
+        optimum_risk_reward.determine_optimum_reward(raw_config, executor=executor)
+        assert cache.info()["size"] == 0
+    finally:
+        disk_cache.disable_disk_cache()
+
+
+def test_library_version_follows_the_sources(monkeypatch):
+    version = disk_cache.library_version()
+    monkeypatch.setattr(disk_cache, "source_hash", lambda: "changed")
+    assert disk_cache.library_version() != version
+
+
+def test_optimum_reward_deadline(raw_config: AppConfig, monkeypatch):
+    with pytest.raises(optimum_risk_reward.TimeoutException):
+        optimum_risk_reward.determine_optimum_reward(
+            raw_config, deadline=optimum_risk_reward.Deadline(0)
+        )
+    expected = optimum_risk_reward.select_optimum_reward(
+        [optimum_risk_reward.eval_func(x, raw_config) for x in range(30, 70)],
+        raw_config,
+    )
+    deadline = optimum_risk_reward.Deadline()
+    evaluated = []
+    eval_func = optimum_risk_reward.eval_func
+
+    def counted(y, *args, **kwargs):
+        if len(evaluated) == 40:
+            deadline.cancel()
+        evaluated.append(y)
+        return eval_func(y, *args, **kwargs)
+
+    monkeypatch.setattr(optimum_risk_reward, "eval_func", counted)
+    result = optimum_risk_reward.determine_optimum_reward(raw_config, deadline=deadline)
+    assert result == {**expected, "partial": True}
+
+
+@pytest.mark.parametrize("search", [False, True])
+def test_optimum_risk_deadline(risk_config: AppConfig, monkeypatch, search):
+    expected = optimum_risk_reward.determine_optimum_risk(
+        risk_config, 0.011, gap=2, multiplier=4, ignore=True
+    )
+    deadline = optimum_risk_reward.Deadline()
+    evaluated = []
+    eval_func = optimum_risk_reward.eval_func
+
+    def counted(y, *args, **kwargs):
+        # stop halfway through the third risk
+        if len(evaluated) == 2 * 169 + 80:
+            deadline.cancel()
+        evaluated.append(y)
+        return eval_func(y, *args, **kwargs)
+
+    monkeypatch.setattr(optimum_risk_reward, "eval_func", counted)
+    result = optimum_risk_reward.determine_optimum_risk(
+        risk_config,
+        0.011,
+        gap=2,
+        multiplier=4,
+        ignore=True,
+        search=search,
+        deadline=deadline,
+    )
+    assert result["partial"]
+    assert result["size"] <= 0.011
+    assert result["value"] < expected["value"]
+
+
+def test_optimum_reward_anytime(raw_config: AppConfig):
+    expected = optimum_risk_reward.determine_optimum_reward(raw_config)
+    candidates = list(optimum_risk_reward.iter_optimum_reward(raw_config))
+    assert candidates[-1]["risk_reward"] == expected["value"]
+    assert candidates[-1]["size"] == expected["total"]
+    # a coarse round found a pick as good, the stream still ends on the full scan
+    assert len(candidates) > 1
+    sizes = [x["size"] for x in candidates]
+    assert sizes == sorted(sizes)
+    elapsed = [x["elapsed"] for x in candidates]
+    assert elapsed == sorted(elapsed)
+
+    async def first():
+        async for x in optimum_risk_reward.aiter_optimum_reward(raw_config):
+            return x
+
+    assert asyncio.run(first())["risk_reward"] == candidates[0]["risk_reward"]
+
+
+def test_optimum_risk_anytime(risk_config: AppConfig, monkeypatch):
+    expected = optimum_risk_reward.determine_optimum_risk(
+        risk_config, 0.011, gap=2, multiplier=4, search=True
+    )
+    candidates = list(
+        optimum_risk_reward.iter_optimum_risk(risk_config, 0.011, gap=2, multiplier=4)
+    )
+    assert {**candidates[-1], "elapsed": None} == {**expected, "elapsed": None}
+    # feasible sizes, each larger than the one before, then the result
+    sizes = [x["size"] for x in candidates]
+    assert sizes[:-1] == sorted(set(sizes[:-1]))
+    assert sizes == sorted(sizes)
+    assert sizes[-1] <= 0.011
+    assert len(candidates) > 1
+    # even the first risk is over max_size: only the fallback is yielded
+    expected = optimum_risk_reward.determine_optimum_risk(
+        risk_config, 0.0001, gap=2, multiplier=4, search=True
+    )
+    assert expected["size"] > 0.0001
+    candidates = list(
+        optimum_risk_reward.iter_optimum_risk(risk_config, 0.0001, gap=2, multiplier=4)
+    )
+    assert [{**x, "elapsed": None} for x in candidates] == [
+        {**expected, "elapsed": None}
+    ]
+    # out of time, the last candidate is the partial result
+    deadline = optimum_risk_reward.Deadline()
+    evaluated = []
+    eval_func = optimum_risk_reward.eval_func
+
+    def counted(y, *args, **kwargs):
+        if len(evaluated) == 2 * 169 + 80:
+            deadline.cancel()
+        evaluated.append(y)
+        return eval_func(y, *args, **kwargs)
+
+    monkeypatch.setattr(optimum_risk_reward, "eval_func", counted)
+    candidates = list(
+        optimum_risk_reward.iter_optimum_risk(
+            risk_config, 0.011, gap=2, multiplier=4, deadline=deadline
+        )
+    )
+    assert candidates[-1]["partial"] is True
+    assert candidates[-1]["size"] <= 0.011
+
+
+def test_in_executor_cancel():
+    closed = []
+
+    def steps():
+        try:
+            while True:
+                time.sleep(0.3)
+                yield 1
+        finally:
+            closed.append(True)
+
+    async def consume():
+        async for _ in optimum_risk_reward.in_executor(steps()):
+            pass
+
+    async def cancel_mid_step():
+        task = asyncio.ensure_future(consume())
+        await asyncio.sleep(0.4)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    asyncio.run(cancel_mid_step())
+    assert closed == [True]
+
+
+def test_reward_selector_top(raw_config: AppConfig):
+    func = [optimum_risk_reward.eval_func(x, raw_config) for x in range(30, 199)]
+    selector = optimum_risk_reward.RewardSelector(raw_config, k=3)
+    for x in func:
+        selector.add(x)
+    top = selector.top()
+    assert top[0] is selector.best()
+    assert top[0] == optimum_risk_reward.determine_optimum_reward(raw_config)
+    diffs = [x["neg.pnl"] + x["risk_per_trade"] for x in func]
+    # the positive net_diffs, else the ones tied for the highest
+    found = [x for x, y in zip(func, diffs) if y > 0] or [
+        x for x, y in zip(func, diffs) if y == max(diffs)
+    ]
+    ranked = sorted(
+        found, key=lambda x: (-x["total"], -(x["neg.pnl"] + x["risk_per_trade"]))
+    )
+    assert [x["value"] for x in top] == [x["value"] for x in ranked[:3]]
+
+
+@pytest.mark.parametrize("executor", ["thread", None])
+def test_optimise_zones(risk_config: AppConfig, monkeypatch, executor):
+    running = []
+    peak = []
+
+    def determine_optimum_risk(app_config, max_size, gap=1, **kwargs):
+        running.append(app_config.entry)
+        peak.append(len(running))
+        time.sleep(0.01)
+        running.remove(app_config.entry)
+        return {"value": app_config.entry, "size": max_size, "gap": gap}
+
+    monkeypatch.setattr(
+        optimum_risk_reward, "determine_optimum_risk", determine_optimum_risk
+    )
+    zones = [{"entry": float(x), "stop": 64280.0, "size": 0.011} for x in range(6)]
+    # without a size the zone is bounded by max_size, like Config does
+    zones[3] = {"entry": 3.0, "stop": 64280.0, "gap": 0.5}
+    result = asyncio.run(
+        optimum_risk_reward.optimise_zones(
+            risk_config,
+            zones,
+            gap=2,
+            executor=executor,
+            no_of_cpu=4,
+            max_concurrent=2,
+            max_size=0.02,
+        )
+    )
+    assert [x["value"] for x in result] == [float(x) for x in range(6)]
+    assert [x["size"] for x in result] == [0.011] * 3 + [0.02] + [0.011] * 2
+    assert [x["gap"] for x in result] == [2] * 3 + [0.5] + [2] * 2
+    assert max(peak) <= 2
+
+
+def test_optimise_zones_on_processes(risk_config: AppConfig):
+    zones = [{"entry": 69040.0, "stop": 64280.0, "size": 0.003, "gap": 2}]
+    expected = optimum_risk_reward.determine_optimum_risk(
+        risk_config, 0.003, gap=2, ignore=True
+    )
+    result = asyncio.run(
+        optimum_risk_reward.optimise_zones(risk_config, zones, no_of_cpu=2)
+    )
+    assert result == [expected]
+    # the shared executor is kept for the next call
+    executor = utils.get_process_executor(2)
+    assert executor.submit(int, "3").result() == 3
+
+
+def test_optimise_zone_cancel(risk_config: AppConfig):
+    zone = {"entry": 69040.0, "stop": 64280.0, "size": 0.011, "gap": 2}
+
+    async def cancelled():
+        task = asyncio.ensure_future(
+            optimum_risk_reward.optimise_zone(risk_config, zone)
+        )
+        ticks = 0
+        while ticks < 3:
+            # the loop keeps running while the zone is optimised
+            await asyncio.sleep(0)
+            ticks += 1
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        return ticks
+
+    assert asyncio.run(cancelled()) == 3
+
+
+def test_optimise_zone_timeout(risk_config: AppConfig, monkeypatch):
+    zone = {"entry": 69040.0, "stop": 64280.0, "size": 0.011, "gap": 2}
+
+    class Deadline(optimum_risk_reward.Deadline):
+        # runs out halfway through the second risk, whatever the speed of the machine
+        checks = 0
+
+        @property
+        def expired(self):
+            Deadline.checks += 1
+            return Deadline.checks > 169 + 80
+
+    monkeypatch.setattr(optimum_risk_reward, "Deadline", Deadline)
+    result = asyncio.run(
+        optimum_risk_reward.optimise_zone(risk_config, zone, timeout=1)
+    )
+    assert result["partial"] is True
+    assert result["size"] <= zone["size"]
@@ -571,3 +571,210 @@ def test_default_build_entry(n_trade_signal):
     ]
 
     assert [x['entry'] for x in result] == expected_output
+
+
+def test_get_margin_range_matches_zone_loop(n_trade_signal):
+    signal = n_trade_signal
+    reference = TradeSignal(**{**signal.config_as_dict, "use_zone_loop": True})
+    prices = [signal.focus * (0.3 + (x * 0.013)) for x in range(200)]
+    for price in prices + [signal.focus, signal.focus * (1 + signal.percent_change)]:
+        assert signal.get_margin_range(price) == reference.get_margin_range(price)
+
+
+def test_array_ladder_matches_list_ladder(n_trade_signal):
+    signal = n_trade_signal
+    reference = TradeSignal(**{**signal.config_as_dict, "use_array_ladder": False})
+    for price in [64000.0, 66500.5, 67629.3, 67800.0, 69000.0, 71000.0]:
+        for kind in ["long", "short"]:
+            assert signal.get_future_range_new(
+                price, kind=kind
+            ) == reference.get_future_range_new(price, kind=kind)
+            assert signal.get_range(price, kind=kind) == reference.get_range(
+                price, kind=kind
+            )
+        ladder = signal.get_future_ladder(price, kind="long")
+        assert ladder.tolist() == signal.get_future_range_new(price, kind="long")
+
+
+def test_columnar_orders_match_trade_dicts(n_trade_signal):
+    signal = n_trade_signal
+    reference = TradeSignal(**{**signal.config_as_dict, "use_columnar_orders": False})
+    for price in [66500.5, 67629.3, 69000.0]:
+        for kind in ["long", "short"]:
+            assert signal.get_bulk_trade_zones(
+                price, kind=kind
+            ) == reference.get_bulk_trade_zones(price, kind=kind)
+    zones = [70495.0, 69500.0, 68000.0, 67629.3, 67000.0, 66400.0, 65858.0]
+    columns = signal.process_orders(67629.3, 65858.0, zones, columnar=True)
+    expected = reference.process_orders(67629.3, 65858.0, zones)
+    assert len(columns) == len(expected)
+    assert list(columns.rows()) == expected
+    assert columns.rows()[-1] == expected[-1]
+
+
+def test_build_orders_leaves_signal_untouched(n_trade_signal):
+    signal = n_trade_signal.with_overrides(take_profit=69000.0)
+    before = {**signal.config_as_dict, "focus": signal.focus}
+    first = signal.build_orders(67629.3, kind="long", replace_focus=True)
+    assert {**signal.config_as_dict, "focus": signal.focus} == before
+    assert signal.build_orders(67629.3, kind="long", replace_focus=True) == first
+    assert n_trade_signal.take_profit is None
+
+
+def test_risk_reward_sweep_matches_full_rebuild(n_trade_signal):
+    signal = n_trade_signal
+    for kind, entry, stop in [("long", 70495.0, 65858.0), ("short", 65858.0, 70495.0)]:
+        for single in [True, False]:
+            params = dict(kind=kind, single=single, lower_bound=30, upper_bound=60)
+            assert signal.determine_optimum_risk_reward(
+                entry, stop, 10, **params
+            ) == signal.determine_optimum_risk_reward(
+                entry, stop, 10, use_sweep=False, **params
+            )
+
+
+def test_zone_cache_is_shared_between_signals(n_trade_signal):
+    from enhanced_lib.calculations.zone_cache import zone_cache
+
+    signal = n_trade_signal
+    uncached = TradeSignal(**{**signal.config_as_dict, "use_zone_cache": False})
+    other = TradeSignal(**{**signal.config_as_dict, "budget": 5000.0})
+    zone_cache.invalidate()
+    zone_cache.reset_stats()
+    for price in [66500.5, 67629.3, 69000.0]:
+        assert signal.get_margin_range(price) == uncached.get_margin_range(price)
+        assert signal.get_margin_zones(price) == uncached.get_margin_zones(price)
+        for kind in ["long", "short"]:
+            assert signal.get_future_zones(
+                price, kind=kind
+            ) == uncached.get_future_zones(price, kind=kind)
+    misses = zone_cache.info()["misses"]
+    other.get_future_zones(67629.3, kind="long")
+    assert zone_cache.info()["misses"] == misses
+    assert zone_cache.info()["hits"] > 0
+    zone_cache.invalidate(focus=signal.focus)
+    assert zone_cache.info()["size"] == 0
+
+
+def test_iter_margin_zones_walks_lazily(n_trade_signal):
+    import itertools
+
+    signal = n_trade_signal
+    for kind in ["long", "short"]:
+        zones = signal.get_margin_zones(67629.3, kind=kind)
+        walked = list(itertools.islice(signal.iter_margin_zones(67629.3, kind), 21))
+        assert walked == zones
+        assert len(set(walked)) == len(walked)
+    first = next(signal.iter_margin_zones(67629.3, kind="long"))
+    assert first == signal.get_margin_range(67629.3)
+
+
+def test_cumulative_open_prices_match_per_trade_average(n_trade_signal):
+    signal = n_trade_signal
+    reference = TradeSignal(**{**signal.config_as_dict, "use_cumulative_avg": False})
+    for kind in ["long", "short"]:
+        trades = signal.build_orders(67629.3, kind=kind)
+        assert len(trades) > 3
+        current_entry = trades[len(trades) // 3]["entry"]
+        for current_qty in [0, 0.05]:
+            assert signal.update_open_prices(
+                trades, current_entry, kind=kind, current_qty=current_qty
+            ) == reference.update_open_prices(
+                trades, current_entry, kind=kind, current_qty=current_qty
+            )
+
+
+def test_bulk_trade_zones_stops_retrying():
+    signal = TradeSignal(
+        focus=5446.6,
+        budget=500,
+        percent_change=0.0353183,
+        price_places="%.2f",
+        decimal_places="%.2f",
+        fee=0.0006,
+        support=5050.73,
+        resistance=5926.9,
+        risk_per_trade=1,
+        risk_reward=35,
+        minimum_size=1,
+        take_profit=5926.9,
+        gap=2,
+    )
+    # the margin range below 5081.33 leads back to 5446.6, which used to recurse
+    # until the interpreter gave up
+    stats = {}
+    assert signal.get_bulk_trade_zones(5926.9, stats=stats) == []
+    assert stats == {
+        "prices": [5926.9, 5446.6, 5081.33],
+        "retries": 2,
+        "stopped": "cycle",
+    }
+    bounded = TradeSignal(**{**signal.config_as_dict, "max_zone_retries": 1})
+    assert bounded.get_bulk_trade_zones(5926.9, stats=stats) == []
+    assert stats == {"prices": [5926.9, 5446.6], "retries": 1, "stopped": "max_retries"}
+    unbounded = TradeSignal(**{**signal.config_as_dict, "max_zone_retries": None})
+    assert unbounded.get_bulk_trade_zones(5926.9, stats=stats) == []
+    assert stats["stopped"] == "cycle"
+
+
+def test_orders_off_zones_on_executor():
+    import concurrent.futures
+
+    signal = TradeSignal(
+        focus=150.25,
+        budget=2000,
+        percent_change=0.02,
+        price_places="%.2f",
+        decimal_places="%.2f",
+        fee=0.0006,
+        support=140,
+        resistance=165,
+        risk_per_trade=3,
+        risk_reward=50,
+        minimum_size=0.1,
+    )
+    expected = signal.build_orders_off_zones(152.5, kind="long")
+    assert expected["orders"]
+    with concurrent.futures.ThreadPoolExecutor(max_workers=2) as executor:
+        result = signal.build_orders_off_zones(152.5, kind="long", executor=executor)
+    assert result == expected
+    assert signal.build_orders_off_zones(152.5, kind="long", executor="thread") == expected
+
+
+def test_process_spot_running_incurred_risk():
+    from enhanced_lib.calculations.trade_signal import process_spot
+
+    spots = [
+        {"risk": 2.0, "entries": [100.0], "sells": [110.0], "pnl": [5.0]},
+        {"risk": 3.0, "entries": [99.0, 98.0], "sells": [105.0, 104.0], "pnl": [1.0, 0.5]},
+        {"risk": 1.0, "entries": [97.0, 96.0], "sells": [100.0, 99.0], "pnl": [9.0, 2.0]},
+    ]
+    result = process_spot(spots)
+    assert [x["incurred_risk"] for x in result] == [0, 2.0, 5.0]
+    assert result[0]["m_orders"] == []
+    assert result[1]["m_orders"] == {"pnl": 1.5, "sell": 104.0, "size": 0.25, "entry": 98.0}
+    assert result[2]["m_orders"] == {"pnl": 3.0, "sell": 99.0, "size": 1.0, "entry": 96.0}
+
+
+def test_size_and_pnl_batch_matches_single_calls(n_trade_signal):
+    import math
+
+    signal = n_trade_signal
+    pairs = [(68000, 65858, "long"), (69000, 67000, "long", 2), (68000, 65858, "long")]
+    kwargs = {"support": 65858, "resistance": 70495, "loss_price": 65000}
+    expected = [
+        signal.calculate_size_and_pnl(
+            x[0], x[1], kind=x[2], risk=x[3] if len(x) > 3 else None, **kwargs
+        )["trade"]
+        for x in pairs
+    ]
+    for executor in [None, "thread"]:
+        result = signal.calculate_size_and_pnl_batch(pairs, executor=executor, **kwargs)
+        assert len(result) == 3 and result.found.all()
+        assert result.kind == ["long", "long", "long"]
+        assert result.avg_size.tolist() == [x["avg_size"] for x in expected]
+        assert result.loss.tolist() == [x["loss"] for x in expected]
+        assert math.isnan(result.ratio[0])
+        assert result.row(1) == {
+            k: v for k, v in expected[1].items() if k not in ("support",)
+        }
@@ -1,7 +1,10 @@
 import pytest
 from enhanced_lib.calculations.utils import (
     group_into_pairs_with_sum_less_than,
-    fibonacci_analysis,determine_fib_support,extend_fibonacci
+    fibonacci_analysis,determine_fib_support,extend_fibonacci,
+    get_precision,
+    create_gap_pairs,
+    determine_cumulative_avgs,
 )
 
 
@@ -105,5 +108,90 @@ def test_extend_fibonacci():
     expected_resistance = 52360.0  # Replace with the expected resistance value
     assert result["support"] == expected_support
     assert result["resistance"] == expected_resistance
-    
-    
+
+
+@pytest.mark.parametrize("places", ["%.0f", "%.1f", "%.3f", "%.8f"])
+def test_precision_matches_string_rounding(places):
+    precision = get_precision(places)
+    values = [0.0, -0.04, 0.125, 0.285, 1.005, 2.675, 67629.35, 1e-05, 123456.789]
+    values += [x / 7 for x in range(-300, 300)]
+    for value in values:
+        assert repr(precision.round(value)) == repr(float(places % value))
+
+
+def test_precision_ticks_round_trip():
+    precision = get_precision("%.1f")
+    assert precision.tick == 0.1
+    assert precision.to_ticks(67629.34) == 676293
+    assert precision.from_ticks(676293) == 67629.3
+    assert precision.is_exact(67629.3)
+    assert not precision.is_exact(67629.34)
+
+
+@pytest.mark.parametrize("gap", [0, 1, 2, 3])
+def test_gap_pair_mapping_matches_item_lookup(gap):
+    arr = [100.0, 99.0, 98.0, 98.0, 97.0, 95.0, 95.0, 94.0]
+    mapping = create_gap_pairs(arr, gap, as_mapping=True)
+    for item in set(arr) | {50.0}:
+        pairs = create_gap_pairs(arr, gap, item)
+        assert mapping.get(item) == (pairs[0][1] if pairs else None)
+    assert create_gap_pairs([], gap, as_mapping=True) == {}
+
+
+@pytest.mark.parametrize("kind", ["long", "short"])
+def test_cumulative_avgs_match_order_by_order(kind):
+    step = -7.3 if kind == "long" else 7.3
+    trades = [
+        {"entry": round(100 + step * i, 1), "quantity": 0.011 * (i + 1)}
+        for i in range(12)
+    ]
+    current_entry = trades[3]["entry"]
+    for ladder in [trades, trades[::-1], trades[5:] + trades[:5]]:
+        for current_qty in [0, 0.25]:
+            expected = determine_cumulative_avgs(
+                ladder, current_entry, current_qty, kind=kind, cumulative=False
+            )
+            result = determine_cumulative_avgs(
+                ladder, current_entry, current_qty, kind=kind
+            )
+            assert result == expected
+    averages = determine_cumulative_avgs(trades, current_entry, kind=kind)
+    assert averages[:3] == [None, None, None]
+    assert all(averages[3:])
+
+
+def test_worker_pool_is_reused():
+    import os
+    from enhanced_lib.calculations.workers.utils import WorkerPool, run_in_parallel
+
+    with WorkerPool(2) as pool:
+        assert not pool.started
+        first = run_in_parallel(os.getpid, [() for _ in range(8)], pool=pool)
+        second = run_in_parallel(os.getpid, [() for _ in range(8)], pool=pool)
+        assert pool.started
+        assert len(set(first) | set(second)) <= 2
+        assert os.getpid() not in first
+    assert not pool.started
+
+
+def test_worker_pool_lock_after_fork():
+    import multiprocessing
+    from enhanced_lib.calculations.workers import utils
+
+    def locks_free():
+        pool = utils.get_pool(3)
+        free = pool._lock.acquire(blocking=False)
+        free = free and utils._pools_lock.acquire(blocking=False)
+        raise SystemExit(0 if free else 1)
+
+    pool = utils.get_pool(3)
+    # fork while both locks are held, as starting a pool does
+    with utils._pools_lock, pool._lock:
+        process = multiprocessing.get_context("fork").Process(
+            target=locks_free, daemon=True
+        )
+        process.start()
+    process.join(10)
+    if process.is_alive():
+        process.kill()
+    assert process.exitcode == 0